@@ -0,0 +1,64 @@
+from time import time
+
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.constants import JWT_REVOKED_CACHE_PREFIX, JWT_USER_CLAIMS
+from users.models import User
+
+
+def issue_access_token(user):
+    """Подписанный токен доступа с данными пользователя в claims."""
+    token = AccessToken.for_user(user)
+    for claim in JWT_USER_CLAIMS:
+        token[claim] = getattr(user, claim)
+    return str(token)
+
+
+def get_revoked_key(token):
+    return JWT_REVOKED_CACHE_PREFIX + token[api_settings.JTI_CLAIM]
+
+
+def revoke_token(token):
+    """Добавляет токен в список отозванных до истечения его срока."""
+    timeout = token['exp'] - int(time())
+    if timeout > 0:
+        cache.set(get_revoked_key(token), True, timeout)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """Аутентификация по подписанному токену без обращения к базе.
+
+    Для чтения пользователь собирается из claims токена. Для изменяющих
+    запросов пользователь загружается из базы, чтобы его можно было
+    безопасно сохранять. Отозванные при выходе токены хранятся в кэше.
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        token = self.get_validated_token(raw_token)
+        if cache.get(get_revoked_key(token)):
+            raise InvalidToken('Токен отозван')
+        if request.method in SAFE_METHODS:
+            return self.get_claims_user(token), token
+        return self.get_user(token), token
+
+    def get_claims_user(self, token):
+        try:
+            user = User(
+                id=token[api_settings.USER_ID_CLAIM],
+                **{claim: token[claim] for claim in JWT_USER_CLAIMS}
+            )
+        except KeyError:
+            raise InvalidToken('В токене нет данных пользователя')
+        user._state.adding = False
+        return user
@@ -0,0 +1,9 @@
+JWT_REVOKED_CACHE_PREFIX = 'jwt:revoked:'
+JWT_USER_CLAIMS = ('username', 'email', 'first_name', 'last_name', 'is_staff',
+                   'is_superuser')
+RECIPE_BATCH_MAX_SIZE = 100
+RECIPE_CACHE_TIMEOUT = 60 * 60 * 24
+SHOPPING_CART_CHUNK_SIZE = 500
+SHOPPING_CART_FORMAT_PARAM = 'file_format'
+SHOPPING_CART_PDF_FONT_SIZE = 12
+SHOPPING_CART_PDF_MARGIN = 20
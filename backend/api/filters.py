@@ -1,5 +1,11 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
 from django_filters.rest_framework import FilterSet, filters
+from rest_framework.filters import OrderingFilter
 
+from recipes.constants import SEARCH_CONFIG
+from recipes.lookups import TrigramWordSimilarity
 from recipes.models import Ingredient, Recipe, Tag
 
 
@@ -16,10 +22,22 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(
+        method='get_search'
+    )
+    ingredients = filters.ModelMultipleChoiceFilter(
+        queryset=Ingredient.objects.all(),
+        method='get_ingredients'
+    )
+    exclude_ingredients = filters.ModelMultipleChoiceFilter(
+        queryset=Ingredient.objects.all(),
+        method='get_exclude_ingredients'
+    )
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart',)
+        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+                  'search', 'ingredients', 'exclude_ingredients',)
 
     def get_is_favorited(self, queryset, name, value):
         """Метод для получения queryset избранных рецептов."""
@@ -35,11 +53,44 @@ class RecipeFilter(FilterSet):
             )
         return queryset
 
+    def get_ingredients(self, queryset, name, value):
+        """Метод для получения рецептов, содержащих все указанные
+        ингредиенты. Условие @> обслуживается GIN-индексом."""
+        if not value:
+            return queryset
+        return queryset.filter(
+            ingredient_ids__contains=[ingredient.id for ingredient in value]
+        )
 
-class IngredientFilter(FilterSet):
-    """Фильтр для поиска ингредиентов по названию"""
-    name = filters.CharFilter(lookup_expr='istartswith')
+    def get_exclude_ingredients(self, queryset, name, value):
+        """Метод для исключения рецептов, содержащих хотя бы один
+        из указанных ингредиентов."""
+        if not value:
+            return queryset
+        return queryset.exclude(
+            ingredient_ids__overlap=[ingredient.id for ingredient in value]
+        )
 
-    class Meta:
-        model = Ingredient
-        fields = ('name', )
+    def get_search(self, queryset, name, value):
+        """Метод полнотекстового поиска по названию и описанию рецепта
+        с нечетким совпадением строки со словами названия по триграммам.
+        Найденные только по триграммам рецепты ранжируются по схожести."""
+        query = SearchQuery(value, config=SEARCH_CONFIG)
+        return queryset.filter(
+            Q(search_vector=query) | Q(name__trigram_word_similar=value)
+        ).annotate(rank=Greatest(
+            SearchRank(F('search_vector'), query),
+            TrigramWordSimilarity(value, 'name')
+        )).order_by('-rank', '-pub_date')
+
+
+class RecipeOrderingFilter(OrderingFilter):
+    """Сортировка рецептов по параметру ordering, например
+    ordering=-favorites_count. Дополняется id, чтобы порядок страниц
+    был устойчивым при одинаковых значениях."""
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering:
+            return (*ordering, '-id')
+        return ordering
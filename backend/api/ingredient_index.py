@@ -0,0 +1,122 @@
+from bisect import bisect_left
+from heapq import heapify, heappop, heappush
+from threading import Lock
+
+from recipes.models import CatalogVersion, Ingredient
+
+MAX_CHAR = chr(0x10FFFF)
+
+
+def normalize(value):
+    """Приводит название к виду для сравнения без учета регистра и ё."""
+    return value.casefold().replace('ё', 'е')
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Ингредиенты хранятся отсортированными по названию, а все суффиксы
+    названий - в отдельном отсортированном массиве, поэтому совпадения
+    по началу названия и по подстроке находятся двоичным поиском.
+    Номера названий суффиксов лежат в листьях дерева минимумов, из
+    которого первые по алфавиту названия с подстрокой извлекаются
+    за время, зависящее от limit, а не от числа вхождений подстроки.
+    Индекс перестраивается, когда меняется версия справочника.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._snapshot = None
+
+    def build(self):
+        """Строит индекс по текущему содержимому таблицы ингредиентов."""
+        version = CatalogVersion.objects.current(
+            CatalogVersion.INGREDIENTS
+        ).version
+        ingredients = sorted(
+            Ingredient.objects.only('id', 'name', 'measurement_unit'),
+            key=lambda ingredient: (normalize(ingredient.name),
+                                    ingredient.measurement_unit)
+        )
+        names = [normalize(ingredient.name) for ingredient in ingredients]
+        suffixes = sorted(
+            (name[start:], position)
+            for position, name in enumerate(names)
+            for start in range(1, len(name))
+        )
+        size = 1
+        while size < len(suffixes):
+            size *= 2
+        tree = [len(names)] * (2 * size)
+        for index, (_, position) in enumerate(suffixes):
+            tree[size + index] = position
+        for node in range(size - 1, 0, -1):
+            tree[node] = min(tree[2 * node], tree[2 * node + 1])
+        self._snapshot = (
+            version,
+            ingredients,
+            names,
+            [suffix for suffix, _ in suffixes],
+            tree,
+        )
+
+    def get_snapshot(self, version):
+        snapshot = self._snapshot
+        if snapshot is None or snapshot[0] != version:
+            with self._lock:
+                if self._snapshot is None or self._snapshot[0] != version:
+                    self.build()
+                snapshot = self._snapshot
+        return snapshot
+
+    def search(self, query, version, limit=None):
+        """Возвращает ингредиенты, название которых начинается с query,
+        а за ними ингредиенты, содержащие query внутри названия."""
+        _, ingredients, names, suffixes, tree = self.get_snapshot(version)
+        query = normalize(query)
+        start = bisect_left(names, query)
+        end = bisect_left(names, query + MAX_CHAR)
+        found = list(range(
+            start, end if limit is None else min(end, start + limit)
+        ))
+        if limit is None or len(found) < limit:
+            lower = bisect_left(suffixes, query)
+            upper = bisect_left(suffixes, query + MAX_CHAR)
+            for position in self.iter_smallest(tree, lower, upper):
+                if limit is not None and len(found) >= limit:
+                    break
+                if not start <= position < end:
+                    found.append(position)
+        return [ingredients[position] for position in found]
+
+    @staticmethod
+    def iter_smallest(tree, lower, upper):
+        """Различные номера названий из листьев [lower, upper) дерева
+        минимумов по возрастанию. Очередь хранит узлы дерева, поэтому
+        каждое следующее значение стоит O(log n)."""
+        size = len(tree) // 2
+        nodes = []
+        lower += size
+        upper += size
+        while lower < upper:
+            if lower & 1:
+                nodes.append((tree[lower], lower))
+                lower += 1
+            if upper & 1:
+                upper -= 1
+                nodes.append((tree[upper], upper))
+            lower //= 2
+            upper //= 2
+        heapify(nodes)
+        previous = None
+        while nodes:
+            position, node = heappop(nodes)
+            if node < size:
+                heappush(nodes, (tree[2 * node], 2 * node))
+                heappush(nodes, (tree[2 * node + 1], 2 * node + 1))
+            elif position != previous:
+                previous = position
+                yield position
+
+
+ingredient_index = IngredientIndex()
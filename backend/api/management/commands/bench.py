@@ -0,0 +1,252 @@
+import json
+import math
+import random
+import subprocess
+import tempfile
+from base64 import b64encode
+from io import BytesIO, StringIO
+from itertools import combinations
+from time import perf_counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import BaseCommand, call_command
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from recipes.management.commands.generate_data import WORDS
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+RECIPE_FILTERS = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+
+
+def percentile(values, share):
+    """Перцентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    # Округление убирает погрешность умножения: 0.07 * 100 = 7.000...01.
+    rank = max(math.ceil(round(share * len(ordered), 9)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    """
+    Management-команда, измеряющая производительность основных
+    эндпоинтов API на сгенерированных данных в тестовой базе.
+    python manage.py bench [--requests N] [--output bench.json]
+    """
+    help = 'Нагрузочный бенчмарк эндпоинтов API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--tags', type=int, default=6)
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Количество запросов на сценарий')
+        parser.add_argument('--warmup', type=int, default=5,
+                            help='Количество прогревочных запросов')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--only', nargs='*', default=None,
+                            help='Запустить только указанные сценарии')
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Не пересоздавать тестовую базу')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options['keepdb']
+        )
+        try:
+            hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(MEDIA_ROOT=media_root,
+                                      ALLOWED_HOSTS=hosts,
+                                      DATABASE_REPLICAS=[]):
+                if not options['keepdb'] or not Recipe.objects.exists():
+                    self.seed(options)
+                cache.clear()
+                results = self.run_scenarios(options)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb']
+            )
+        report = json.dumps({
+            'commit': self.get_commit(),
+            'database': connection.vendor,
+            'dataset': {key: options[key] for key in
+                        ('users', 'recipes', 'tags', 'seed')},
+            'requests': options['requests'],
+            'scenarios': results,
+        }, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(report)
+        self.stdout.write(report)
+
+    def get_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def seed(self, options):
+        """Заполняет тестовую базу детерминированным набором данных."""
+        Tag.objects.bulk_create(
+            Tag(name=f'Тэг {i}', slug=f'tag{i}', color=f'#{i:06x}')
+            for i in range(options['tags'])
+        )
+        call_command(
+            'generate_data', users=options['users'],
+            recipes=options['recipes'], seed=options['seed'],
+            stdout=StringIO()
+        )
+        call_command('build_similar_recipes', stdout=StringIO())
+
+    def get_scenarios(self):
+        """Сценарии: имя и функция, возвращающая запросы итерации."""
+        rand = self.random
+        user = User.objects.order_by('pk').first()
+        recipe_ids = list(Recipe.objects.values_list('pk', flat=True))
+        own_recipe = Recipe.objects.filter(author=user).order_by('pk').first()
+        favorites = set(user.favorite_related.values_list('recipe', flat=True))
+        carts = set(user.shoppingcart_related.values_list('recipe', flat=True))
+        toggled = [pk for pk in recipe_ids
+                   if pk not in favorites and pk not in carts]
+        tags = list(Tag.objects.values_list('pk', 'slug'))
+        ingredient_ids = list(Ingredient.objects.values_list('pk', flat=True))
+        compositions = list(Recipe.objects.exclude(
+            ingredient_ids=[]
+        ).values_list('ingredient_ids', flat=True)[:100])
+        author = Recipe.objects.values_list('author', flat=True).first()
+        filter_values = {
+            'tags': f'tags={tags[0][1]}&tags={tags[-1][1]}',
+            'author': f'author={author}',
+            'is_favorited': 'is_favorited=1',
+            'is_in_shopping_cart': 'is_in_shopping_cart=1',
+        }
+        image = BytesIO()
+        Image.new('RGB', (640, 480), 'orange').save(image, 'PNG')
+        image = 'data:image/png;base64,' + b64encode(image.getvalue()).decode()
+
+        def recipe_payload(i):
+            return {
+                'name': f'рецепт {rand.choice(WORDS)}',
+                'text': ' '.join(rand.choices(WORDS, k=30)),
+                'cooking_time': 10 + i % 50,
+                'tags': [tags[i % len(tags)][0]],
+                'ingredients': [
+                    {'id': pk, 'amount': 1 + i % 100}
+                    for pk in rand.sample(ingredient_ids, 8)
+                ],
+            }
+
+        def toggle(action):
+            def make_requests(i):
+                url = f'/api/recipes/{toggled[i % len(toggled)]}/{action}/'
+                return [('POST', url), ('DELETE', url)]
+            return make_requests
+
+        scenarios = {}
+        for size in range(len(RECIPE_FILTERS) + 1):
+            for combination in combinations(RECIPE_FILTERS, size):
+                query = '&'.join(filter_values[name] for name in combination)
+                name = 'recipes_list[' + '+'.join(combination) + ']'
+                scenarios[name] = (
+                    lambda i, query=query: [('GET', f'/api/recipes/?{query}')]
+                )
+        scenarios.update({
+            'recipes_cursor': lambda i: [('GET', '/api/recipes/?cursor=')],
+            'recipes_search': lambda i: [
+                ('GET', f'/api/recipes/?search={WORDS[i % len(WORDS)]}')
+            ],
+            'recipes_ingredients': lambda i: [
+                ('GET', '/api/recipes/?' + '&'.join(
+                    f'ingredients={pk}'
+                    for pk in compositions[i % len(compositions)][:2]
+                ) + f'&exclude_ingredients={ingredient_ids[i % 10]}')
+            ],
+            'recipe_detail': lambda i: [
+                ('GET', f'/api/recipes/{recipe_ids[i % len(recipe_ids)]}/')
+            ],
+            'feed': lambda i: [('GET', '/api/recipes/feed/')],
+            'similar': lambda i: [
+                ('GET', f'/api/recipes/{recipe_ids[i % len(recipe_ids)]}/'
+                        'similar/')
+            ],
+            'subscriptions': lambda i: [
+                ('GET', '/api/users/subscriptions/?recipes_limit=3')
+            ],
+            'ingredients_search': lambda i: [
+                ('GET', f'/api/ingredients/?name={WORDS[i % len(WORDS)][:3]}')
+            ],
+            'download_shopping_cart': lambda i: [
+                ('GET', '/api/recipes/download_shopping_cart/')
+            ],
+            'favorite_toggle': toggle('favorite'),
+            'shopping_cart_toggle': toggle('shopping_cart'),
+            'recipe_create': lambda i: [
+                ('POST', '/api/recipes/',
+                 {**recipe_payload(i), 'image': image})
+            ],
+            'recipe_update': lambda i: [
+                ('PATCH', f'/api/recipes/{own_recipe.pk}/', recipe_payload(i))
+            ],
+        })
+        return user, scenarios
+
+    def run_scenarios(self, options):
+        user, scenarios = self.get_scenarios()
+        token = Token.objects.get_or_create(user=user)[0]
+        client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        results = {}
+        for name, make_requests in scenarios.items():
+            if options['only'] and name not in options['only']:
+                continue
+            for i in range(options['warmup']):
+                for request in make_requests(i):
+                    self.send(client, *request)
+            samples = []
+            errors = 0
+            started = perf_counter()
+            for i in range(options['requests']):
+                for request in make_requests(options['warmup'] + i):
+                    with CaptureQueriesContext(connection) as queries:
+                        start = perf_counter()
+                        status = self.send(client, *request)
+                        elapsed = perf_counter() - start
+                    errors += status >= 400
+                    samples.append((elapsed, len(queries)))
+            duration = perf_counter() - started
+            latencies = [elapsed * 1000 for elapsed, _ in samples]
+            results[name] = {
+                'requests': len(samples),
+                'errors': errors,
+                'p50_ms': round(percentile(latencies, 0.50), 2),
+                'p95_ms': round(percentile(latencies, 0.95), 2),
+                'p99_ms': round(percentile(latencies, 0.99), 2),
+                'mean_ms': round(sum(latencies) / len(latencies), 2),
+                'queries': round(
+                    sum(count for _, count in samples) / len(samples), 2
+                ),
+                'throughput_rps': round(len(samples) / duration, 1),
+            }
+            self.stderr.write(f'{name}: p50 {results[name]["p50_ms"]} ms, '
+                              f'{results[name]["queries"]} queries')
+        return results
+
+    def send(self, client, method, url, data=None):
+        """Отправляет запрос и дочитывает потоковый ответ."""
+        response = getattr(client, method.lower())(
+            url, data=json.dumps(data) if data is not None else None,
+            content_type='application/json'
+        )
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response.status_code
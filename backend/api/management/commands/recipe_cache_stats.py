@@ -0,0 +1,31 @@
+from django.core.management import BaseCommand
+
+from api.recipe_cache import recipe_cache
+
+
+class Command(BaseCommand):
+    """
+    Management-команда, выводящая статистику кэша представлений рецептов.
+    python manage.py recipe_cache_stats [--reset]
+    Счетчики хранятся в кэше Django, поэтому для сбора статистики со всех
+    процессов должен использоваться общий бэкенд кэша (CACHE_BACKEND).
+    """
+    help = 'Статистика попаданий в кэш представлений рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Обнулить счетчики после вывода',
+        )
+
+    def handle(self, *args, **options):
+        hits, misses = recipe_cache.stats()
+        total = hits + misses
+        hit_rate = hits / total * 100 if total else 0
+        self.stdout.write(
+            f'Попаданий: {hits}, промахов: {misses}, '
+            f'доля попаданий: {hit_rate:.1f}%'
+        )
+        if options['reset']:
+            recipe_cache.reset_stats()
@@ -0,0 +1,55 @@
+from calendar import timegm
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from foodgram.instrumentation import timed
+from recipes.models import CatalogVersion
+
+
+class CatalogConditionalMixin:
+    """Миксин условных GET-запросов для справочников.
+    ETag и Last-Modified строятся по версии справочника, поэтому
+    при неизменном справочнике клиент получает 304 без сериализации."""
+    catalog_name = None
+
+    def get_catalog_version(self):
+        if not hasattr(self, '_catalog_version'):
+            self._catalog_version = CatalogVersion.objects.current(
+                self.catalog_name
+            )
+        return self._catalog_version
+
+    def conditional_response(self, request, handler, *args, **kwargs):
+        """Отдает 304 или результат handler с заголовками валидации."""
+        catalog = self.get_catalog_version()
+        etag = quote_etag(f'{catalog.name}-{catalog.version}-'
+                          f'{request.accepted_renderer.format}')
+        last_modified = timegm(catalog.updated_at.utctimetuple())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            patch_cache_control(response, public=True, no_cache=True)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().list,
+                                         *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().retrieve,
+                                         *args, **kwargs)
+
+
+class TimedSerializerMixin:
+    """Миксин, учитывающий время сериализации в метриках запроса.
+    Вложенные сериализаторы не учитываются повторно."""
+
+    @timed('serialize')
+    def to_representation(self, instance):
+        return super().to_representation(instance)
@@ -0,0 +1,67 @@
+from django.core.cache import cache
+
+from api.constants import RECIPE_CACHE_TIMEOUT
+from recipes.models import CatalogVersion
+
+HITS_KEY = 'recipe-cache:hits'
+MISSES_KEY = 'recipe-cache:misses'
+
+
+class RecipeRepresentationCache:
+    """Кэш не зависящей от пользователя части представления рецепта.
+
+    Ключ содержит id и версию рецепта, версии справочников тэгов и
+    ингредиентов, схему и хост запроса (в представлении абсолютные
+    ссылки на картинки), поэтому устаревшие записи не удаляются
+    явно, а просто перестают запрашиваться.
+    """
+
+    def get_keys(self, recipes, request):
+        tags_version, ingredients_version = CatalogVersion.objects.versions(
+            CatalogVersion.TAGS, CatalogVersion.INGREDIENTS
+        )
+        origin = (f'{request.scheme}://{request.get_host()}'
+                  if request is not None else '')
+        return {
+            recipe.id: (f'recipe:{recipe.id}:{recipe.version}:'
+                        f'{tags_version}:{ingredients_version}:{origin}')
+            for recipe in recipes
+        }
+
+    def get_many(self, keys):
+        """Возвращает найденные в кэше представления по id рецептов."""
+        found = cache.get_many(keys.values())
+        cached = {
+            recipe_id: found[key]
+            for recipe_id, key in keys.items() if key in found
+        }
+        self.count(HITS_KEY, len(cached))
+        self.count(MISSES_KEY, len(keys) - len(cached))
+        return cached
+
+    def set_many(self, keys, representations):
+        cache.set_many(
+            {keys[recipe_id]: data
+             for recipe_id, data in representations.items()},
+            RECIPE_CACHE_TIMEOUT
+        )
+
+    def count(self, key, value):
+        if not value:
+            return
+        try:
+            cache.incr(key, value)
+        except ValueError:
+            if not cache.add(key, value, None):
+                cache.incr(key, value)
+
+    def stats(self):
+        """Возвращает количество попаданий и промахов кэша."""
+        counters = cache.get_many((HITS_KEY, MISSES_KEY))
+        return counters.get(HITS_KEY, 0), counters.get(MISSES_KEY, 0)
+
+    def reset_stats(self):
+        cache.delete_many((HITS_KEY, MISSES_KEY))
+
+
+recipe_cache = RecipeRepresentationCache()
@@ -1,18 +1,43 @@
 from django.db import transaction
-from django.shortcuts import get_object_or_404
+from django.db.models import Manager
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer
 from rest_framework.validators import UniqueTogetherValidator
 
+from api.constants import RECIPE_BATCH_MAX_SIZE
+from api.mixins import TimedSerializerMixin
+from api.recipe_cache import recipe_cache
+from foodgram.instrumentation import timed
+from jobs.models import Job
 from recipes.constants import MAX_INGREDIENT_AMOUNT, MIN_INGREDIENT_AMOUNT
 from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
-                            ShoppingCart, Subscription, Tag)
+                            ShoppingCart, Subscription, Tag, change_counter,
+                            prefetch_recipe_relations)
+from recipes.tasks import (fan_out_recipe, refresh_shopping_lists,
+                           refresh_similar_recipes)
 from users.models import User
 
 
-class CustomUserSerializer(UserSerializer):
+class ImageVariantField(serializers.ImageField):
+    """Поле варианта картинки рецепта. Пока вариант не построен,
+    возвращает ссылку на оригинал."""
+
+    def __init__(self, size, image_format='webp', **kwargs):
+        self.size = size
+        self.image_format = image_format
+        kwargs['read_only'] = True
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return super().to_representation(
+            value.get_image_variant(self.size, self.image_format)
+        )
+
+
+class CustomUserSerializer(TimedSerializerMixin, UserSerializer):
     """Сериализатор для модели User при чтении данных."""
     is_subscribed = serializers.SerializerMethodField()
 
@@ -24,6 +49,9 @@ class CustomUserSerializer(UserSerializer):
 
     def get_is_subscribed(self, obj):
         """Метод проверки подписан ли пользователь."""
+        is_subscribed = getattr(obj, 'is_subscribed', None)
+        if is_subscribed is not None:
+            return is_subscribed
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -40,14 +68,14 @@ class CustomUserCreateSerializer(UserCreateSerializer):
                   'last_name', 'is_subscribed', 'password')
 
 
-class TagSerializer(ModelSerializer):
+class TagSerializer(TimedSerializerMixin, ModelSerializer):
     """Сериализатор для модели Tag."""
     class Meta:
         model = Tag
         fields = ('id', 'name', 'color', 'slug')
 
 
-class IngredientSerializer(ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, ModelSerializer):
     """Сериализатор для модели Ingredient при чтении данных."""
     class Meta:
         model = Ingredient
@@ -56,10 +84,7 @@ class IngredientSerializer(ModelSerializer):
 
 class IngredientinRecipeCreateSerializer(ModelSerializer):
     """Сериализатор для модели IngredientInRecipe при записи данных."""
-    id = serializers.PrimaryKeyRelatedField(
-        source='ingredient',
-        queryset=Ingredient.objects.all()
-    )
+    id = serializers.IntegerField()
     amount = serializers.IntegerField(write_only=True,
                                       min_value=MIN_INGREDIENT_AMOUNT,
                                       max_value=MAX_INGREDIENT_AMOUNT)
@@ -84,7 +109,16 @@ class IngredientInRecipeSerializer(ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeSerializer(ModelSerializer):
+class RecipeListSerializer(serializers.ListSerializer):
+    """Сериализатор списка рецептов с общим кэшем представлений."""
+
+    def to_representation(self, data):
+        if isinstance(data, Manager):
+            data = data.all()
+        return self.child.represent(list(data))
+
+
+class RecipeSerializer(TimedSerializerMixin, ModelSerializer):
     """Сериализатор для модели Recipe при чтении данных."""
     author = CustomUserSerializer(read_only=True)
     tags = TagSerializer(many=True, read_only=True)
@@ -93,16 +127,78 @@ class RecipeSerializer(ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField()
+    image_small = ImageVariantField(size='small')
+    image_large = ImageVariantField(size='large')
+    image_small_jpeg = ImageVariantField(size='small', image_format='jpeg')
+    image_large_jpeg = ImageVariantField(size='large', image_format='jpeg')
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart', 'name',
-                  'image', 'text', 'cooking_time'
+                  'image', 'image_small', 'image_large', 'image_small_jpeg',
+                  'image_large_jpeg', 'text', 'cooking_time'
                   )
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        """Метод представления модели."""
+        return self.represent([instance])[0]
+
+    @timed('serialize')
+    def represent(self, recipes):
+        """Метод представления рецептов: общая для всех пользователей
+        часть берется из кэша, поля пользователя вычисляются заново."""
+        keys = recipe_cache.get_keys(recipes, self.context.get('request'))
+        shared = recipe_cache.get_many(keys)
+        missing = [recipe for recipe in recipes if recipe.id not in shared]
+        if missing:
+            prefetch_recipe_relations(missing)
+            built = {}
+            for recipe in missing:
+                recipe.author.is_subscribed = self.get_is_author_subscribed(
+                    recipe
+                )
+                data = super().to_representation(recipe)
+                built[recipe.id] = {
+                    **data,
+                    'is_favorited': None,
+                    'is_in_shopping_cart': None,
+                    'author': {**data['author'], 'is_subscribed': None},
+                }
+            recipe_cache.set_many(keys, built)
+            shared.update(built)
+        return [self.overlay(shared[recipe.id], recipe) for recipe in recipes]
+
+    def overlay(self, data, recipe):
+        """Метод добавления полей, зависящих от пользователя."""
+        return {
+            **data,
+            'is_favorited': self.get_is_favorited(recipe),
+            'is_in_shopping_cart': self.get_is_in_shopping_cart(recipe),
+            'author': {
+                **data['author'],
+                'is_subscribed': self.get_is_author_subscribed(recipe),
+            },
+        }
+
+    def get_is_author_subscribed(self, obj):
+        """Метод проверки подписки пользователя на автора."""
+        is_author_subscribed = getattr(obj, 'is_author_subscribed', None)
+        if is_author_subscribed is not None:
+            return is_author_subscribed
+        user = self.context.get('request').user
+        if user.is_anonymous:
+            return False
+        return Subscription.objects.filter(
+            user=user, author__id=obj.author_id
+        ).exists()
 
     def get_is_favorited(self, obj):
         """Метод проверки добавлено ли в избранное."""
+        is_favorited = getattr(obj, 'is_favorited', None)
+        if is_favorited is not None:
+            return is_favorited
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -112,6 +208,9 @@ class RecipeSerializer(ModelSerializer):
 
     def get_is_in_shopping_cart(self, obj):
         """Метод проверки на присутствие в листе покупок."""
+        is_in_shopping_cart = getattr(obj, 'is_in_shopping_cart', None)
+        if is_in_shopping_cart is not None:
+            return is_in_shopping_cart
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -120,21 +219,22 @@ class RecipeSerializer(ModelSerializer):
         ).exists()
 
 
-class ShortRecipeSerializer(ModelSerializer):
+class ShortRecipeSerializer(TimedSerializerMixin, ModelSerializer):
     """"Сериализатор для короткой версии рецептов модели Recipe."""
+    image_small = ImageVariantField(size='small')
+    image_small_jpeg = ImageVariantField(size='small', image_format='jpeg')
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'cooking_time', 'image')
+        fields = ('id', 'name', 'cooking_time', 'image', 'image_small',
+                  'image_small_jpeg')
 
 
 class RecipeCreateSerializer(ModelSerializer):
     """Сериализатор модели Recipe при записи данных."""
     ingredients = IngredientinRecipeCreateSerializer(many=True)
     author = CustomUserSerializer(read_only=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True
-    )
+    tags = serializers.ListField(child=serializers.IntegerField())
     image = Base64ImageField()
 
     class Meta:
@@ -143,30 +243,49 @@ class RecipeCreateSerializer(ModelSerializer):
                   'ingredients', 'tags', 'cooking_time')
 
     def validate_ingredients(self, value):
-        """Метод валидации ингредиентов в рецепте."""
-        ingredients = self.initial_data.get('ingredients')
-        if len(ingredients) < 1:
+        """Метод валидации ингредиентов в рецепте. Все идентификаторы
+        проверяются одним запросом, ошибка перечисляет их все сразу."""
+        if len(value) < 1:
             raise serializers.ValidationError(
                 'В рецепте должен быть хотя бы один ингредиент'
             )
-        ingredients_list = []
-        for ingredient in ingredients:
-            ingredient_check = get_object_or_404(Ingredient,
-                                                 id=ingredient['id'])
-            if ingredient_check in ingredients_list:
-                raise serializers.ValidationError(
-                    'Ингредиенты в рецепте не должны повторяться'
-                )
-            ingredients_list.append(ingredient_check)
+        errors = {}
+        seen = set()
+        duplicates = set()
+        for ingredient in value:
+            if ingredient['id'] in seen:
+                duplicates.add(ingredient['id'])
+            seen.add(ingredient['id'])
+        if duplicates:
+            errors['duplicate_ids'] = sorted(duplicates)
+        missing = seen - set(Ingredient.objects.filter(
+            pk__in=seen
+        ).values_list('pk', flat=True))
+        if missing:
+            errors['missing_ids'] = sorted(missing)
+        if errors:
+            raise serializers.ValidationError(errors)
         return value
 
+    def validate_tags(self, value):
+        """Метод валидации тэгов рецепта одним запросом."""
+        tags = set(value)
+        missing = tags - set(Tag.objects.filter(
+            pk__in=tags
+        ).values_list('pk', flat=True))
+        if missing:
+            raise serializers.ValidationError(
+                {'missing_ids': sorted(missing)}
+            )
+        return list(tags)
+
     @transaction.atomic
     def create_ingredients(self, ingredients, recipe):
         """Метод создания ингредиента."""
         create_ingredients = [
             IngredientInRecipe(
                 recipe=recipe,
-                ingredient=ingredient['ingredient'],
+                ingredient_id=ingredient['id'],
                 amount=ingredient['amount']
             )
             for ingredient in ingredients
@@ -175,23 +294,84 @@ class RecipeCreateSerializer(ModelSerializer):
             create_ingredients
         )
 
+    @transaction.atomic
     def create(self, validated_data):
         """Метод создания рецепта."""
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        recipe = Recipe.objects.create(**validated_data)
+        recipe = Recipe.objects.create(
+            **validated_data,
+            ingredient_ids=sorted(
+                ingredient['id'] for ingredient in ingredients
+            )
+        )
         recipe.tags.set(tags)
         self.create_ingredients(ingredients, recipe)
+        change_counter(User.objects.filter(pk=recipe.author_id),
+                       'recipes_count', 1)
+        Job.objects.enqueue(fan_out_recipe, recipe_id=recipe.id)
+        Job.objects.enqueue(refresh_similar_recipes, recipe_ids=[recipe.id])
         return recipe
 
+    def update_ingredients(self, ingredients, recipe):
+        """Метод изменения ингредиентов рецепта по разнице с текущими:
+        удаляются, добавляются и обновляются только изменившиеся строки.
+        Возвращает идентификаторы удаленных и добавленных ингредиентов
+        и идентификаторы ингредиентов с изменившимся количеством."""
+        current = {
+            item.ingredient_id: item
+            for item in recipe.total_ingredients.all()
+        }
+        amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        removed = current.keys() - amounts.keys()
+        added = amounts.keys() - current.keys()
+        changed = [
+            item for ingredient_id, item in current.items()
+            if ingredient_id in amounts
+            and item.amount != amounts[ingredient_id]
+        ]
+        if removed:
+            IngredientInRecipe.objects.filter(
+                recipe=recipe, ingredient__in=removed
+            ).delete()
+        if added:
+            IngredientInRecipe.objects.bulk_create(
+                IngredientInRecipe(recipe=recipe, ingredient_id=ingredient_id,
+                                   amount=amounts[ingredient_id])
+                for ingredient_id in added
+            )
+        for item in changed:
+            item.amount = amounts[item.ingredient_id]
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ['amount'])
+        return removed | added, {item.ingredient_id for item in changed}
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         """Изменение рецепта."""
         tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
-        IngredientInRecipe.objects.filter(recipe=instance).delete()
-        instance.tags.clear()
+        tags_changed = set(tags) != set(
+            instance.tags.values_list('id', flat=True)
+        )
         instance.tags.set(tags)
-        self.create_ingredients(ingredients, instance)
+        ingredients = validated_data.pop('ingredients')
+        composition, amounts = self.update_ingredients(ingredients, instance)
+        validated_data['ingredient_ids'] = sorted(
+            ingredient['id'] for ingredient in ingredients
+        )
+        if composition or tags_changed:
+            Job.objects.enqueue(refresh_similar_recipes,
+                                recipe_ids=[instance.id])
+        ingredient_ids = composition | amounts
+        user_ids = list(instance.shoppingcart_related.values_list(
+            'user', flat=True
+        )) if ingredient_ids else []
+        if user_ids:
+            Job.objects.enqueue(refresh_shopping_lists, user_ids=user_ids,
+                                ingredient_ids=list(ingredient_ids))
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
@@ -208,7 +388,6 @@ class SubscriptionSerializer(CustomUserSerializer):
     """Сериализатор для модели Subscription при чтении данных."""
 
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -222,18 +401,16 @@ class SubscriptionSerializer(CustomUserSerializer):
     def get_recipes(self, obj):
         """Метод для получения рецептов"""
         request = self.context.get('request')
-        recipes_limit = request.GET.get('recipes_limit')
-        recipes = Recipe.objects.filter(author__id=obj.id)
-        if recipes_limit:
-            recipes = recipes[:int(recipes_limit)]
+        recipes = getattr(obj, 'recipes_preview', None)
+        if recipes is None:
+            recipes_limit = request.GET.get('recipes_limit')
+            recipes = Recipe.objects.filter(author__id=obj.id)
+            if recipes_limit:
+                recipes = recipes[:int(recipes_limit)]
         context = {'request': request}
         return ShortRecipeSerializer(recipes, many=True,
                                      context=context).data
 
-    def get_recipes_count(self, obj):
-        """Метод для получения количества рецептов."""
-        return obj.recipes.count()
-
 
 class SubscriptionCreateSerializer(ModelSerializer):
     """Сериализатор для модели Subscription при записи данных."""
@@ -285,6 +462,16 @@ class FavoriteSerializer(ModelSerializer):
         ).data
 
 
+class RecipeBatchSerializer(serializers.Serializer):
+    """Сериализатор списка рецептов для пакетного добавления и удаления
+    из избранного и списка покупок."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=RECIPE_BATCH_MAX_SIZE
+    )
+
+
 class ShoppingCartSerialiser(ModelSerializer):
     """Сериализатор модели ShoppingCart."""
     class Meta:
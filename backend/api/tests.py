@@ -0,0 +1,376 @@
+import json
+import re
+import shutil
+import tempfile
+from base64 import urlsafe_b64encode
+from collections import Counter
+from io import BytesIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.pagination import FoodgramPagination
+from jobs.models import Job
+from recipes.images import build_image_variants
+from recipes.models import (Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, ShoppingListItem, SimilarRecipe,
+                            Subscription, Tag, change_counter)
+from recipes.tasks import refresh_similar_recipes
+from users.models import User
+
+WRITE_STATEMENT = re.compile(r'^(INSERT INTO|UPDATE|DELETE FROM) "(\w+)"')
+
+AUTHORS_COUNT = 3
+RECIPES_PER_AUTHOR = 6
+INGREDIENTS_PER_RECIPE = 3
+
+# Количество SQL-запросов на один запрос к эндпоинту без кэша.
+# Не должно зависеть от количества объектов на странице.
+RECIPE_LIST_QUERIES = 6
+RECIPE_DETAIL_QUERIES = 5
+SUBSCRIPTIONS_QUERIES = 4
+
+
+class FoodgramTestCase(TestCase):
+    """Авторы с рецептами и пользователь, подписанный на всех авторов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@example.com', username='reader',
+            first_name='Читатель', last_name='Тестовый', password='pass'
+        )
+        cls.token = Token.objects.create(user=cls.user)
+        cls.tags = [
+            Tag.objects.create(name=f'тэг {number}', slug=f'tag-{number}',
+                               color=f'#00000{number}')
+            for number in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(10)
+        ]
+        cls.authors = []
+        for number in range(AUTHORS_COUNT):
+            author = User.objects.create_user(
+                email=f'author{number}@example.com',
+                username=f'author{number}', first_name='Автор',
+                last_name=f'Номер {number}', password='pass'
+            )
+            cls.authors.append(author)
+            Subscription.objects.create(user=cls.user, author=author)
+            for position in range(RECIPES_PER_AUTHOR):
+                cls.create_recipe(author, position)
+            change_counter(User.objects.filter(pk=author.pk),
+                           'recipes_count', RECIPES_PER_AUTHOR)
+
+    @classmethod
+    def create_recipe(cls, author, position):
+        recipe = Recipe.objects.create(
+            author=author, name='тестовый рецепт', text='описание',
+            image='recipes/test.png', cooking_time=10
+        )
+        recipe.tags.set(cls.tags[:2])
+        Recipe.objects.filter(pk=recipe.pk).update(
+            **recipe.get_image_variant_names()
+        )
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient,
+                               amount=position + 1)
+            for ingredient in cls.ingredients[
+                position:position + INGREDIENTS_PER_RECIPE
+            ]
+        )
+        return recipe
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        )
+
+    def get_within_budget(self, url, queries):
+        """GET-запрос с пустым кэшем представлений рецептов, который
+        должен уложиться в queries SQL-запросов."""
+        cache.clear()
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+
+class QueryBudgetTest(FoodgramTestCase):
+    """Количество SQL-запросов на эндпоинт не растет с размером
+    страницы: возвращение N+1 ломает эти тесты."""
+
+    def test_recipe_list(self):
+        for page_size in (2, 12):
+            with self.subTest(page_size=page_size), mock.patch.object(
+                FoodgramPagination, 'page_size', page_size
+            ):
+                response = self.get_within_budget('/api/recipes/',
+                                                  RECIPE_LIST_QUERIES)
+                self.assertEqual(len(response.data['results']), page_size)
+
+    def test_recipe_detail(self):
+        recipe = Recipe.objects.first()
+        response = self.get_within_budget(f'/api/recipes/{recipe.id}/',
+                                          RECIPE_DETAIL_QUERIES)
+        self.assertEqual(len(response.data['ingredients']),
+                         INGREDIENTS_PER_RECIPE)
+
+    def test_subscriptions(self):
+        for page_size in (1, AUTHORS_COUNT):
+            with self.subTest(page_size=page_size), mock.patch.object(
+                FoodgramPagination, 'page_size', page_size
+            ):
+                response = self.get_within_budget(
+                    '/api/users/subscriptions/?recipes_limit=3',
+                    SUBSCRIPTIONS_QUERIES
+                )
+                self.assertEqual(len(response.data['results']), page_size)
+                for author in response.data['results']:
+                    latest = Recipe.objects.filter(
+                        author=author['id']
+                    ).order_by('-pub_date', '-id').values_list('id', flat=True)
+                    self.assertEqual(
+                        [recipe['id'] for recipe in author['recipes']],
+                        list(latest[:3])
+                    )
+                    self.assertEqual(author['recipes_count'],
+                                     RECIPES_PER_AUTHOR)
+
+
+class RecipeCacheTest(FoodgramTestCase):
+    """Кэш представлений рецептов."""
+
+    def test_scheme_in_image_urls(self):
+        cache.clear()
+        recipe = Recipe.objects.first()
+        for secure, scheme in ((False, 'http://'), (True, 'https://')):
+            with self.subTest(scheme=scheme):
+                response = self.client.get(f'/api/recipes/{recipe.id}/',
+                                           secure=secure)
+                self.assertTrue(response.data['image'].startswith(scheme))
+
+
+class CursorPaginationTest(FoodgramTestCase):
+    """Постраничный вывод рецептов по курсору."""
+
+    def test_pages_follow_each_other(self):
+        seen = []
+        url = '/api/recipes/?cursor='
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(recipe['id'] for recipe in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, list(Recipe.objects.order_by(
+            '-pub_date', '-id'
+        ).values_list('id', flat=True)))
+
+    def test_invalid_cursor(self):
+        for position in ('abc', ['вчера', 1], ['2021-01-01T00:00:00', 'x'],
+                         [None, 1], ['2021-01-01T00:00:00', [1]]):
+            cursor = urlsafe_b64encode(json.dumps(position).encode())
+            with self.subTest(position=position):
+                response = self.client.get(
+                    f'/api/recipes/?cursor={cursor.decode()}'
+                )
+                self.assertEqual(response.status_code, 404)
+
+
+class ShoppingCartDownloadTest(FoodgramTestCase):
+    """Выгрузка списка покупок в доступных форматах."""
+
+    def setUp(self):
+        super().setUp()
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(user=self.user, ingredient=ingredient,
+                             amount=number + 1)
+            for number, ingredient in enumerate(self.ingredients)
+        )
+
+    def download(self, file_format):
+        response = self.client.get(
+            f'/api/recipes/download_shopping_cart/?file_format={file_format}'
+        )
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_text_formats(self):
+        for file_format in ('txt', 'csv'):
+            with self.subTest(file_format=file_format):
+                content = self.download(file_format).decode()
+                for ingredient in self.ingredients:
+                    self.assertIn(ingredient.name, content)
+
+    def test_pdf(self):
+        content = self.download('pdf')
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertTrue(content.rstrip().endswith(b'%%EOF'))
+
+
+class ImageVariantsTest(FoodgramTestCase):
+    """Построение вариантов картинки рецепта."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.recipe = Recipe.objects.first()
+        self.set_image('first.png')
+
+    def set_image(self, name):
+        buffer = BytesIO()
+        image = Image.new('RGBA', (2000, 1000), (255, 0, 0, 128))
+        image.save(buffer, 'PNG')
+        self.recipe.image.save(name, ContentFile(buffer.getvalue()))
+
+    def build(self):
+        build_image_variants(self.recipe.id)
+        self.recipe.refresh_from_db()
+        return self.recipe.get_image_variant_names()
+
+    def test_variants_in_all_formats(self):
+        for field, name in self.build().items():
+            with self.subTest(field=field):
+                self.assertEqual(getattr(self.recipe, field).name, name)
+                with Image.open(getattr(self.recipe, field)) as image:
+                    self.assertLessEqual(max(image.size), 1024)
+                    self.assertEqual(image.format,
+                                     'JPEG' if 'jpeg' in field else 'WEBP')
+
+    def test_previous_variants_deleted(self):
+        previous = self.build().values()
+        self.set_image('second.png')
+        current = self.build().values()
+        storage = self.recipe.image.storage
+        for name in previous:
+            self.assertFalse(storage.exists(name))
+        for name in current:
+            self.assertTrue(storage.exists(name))
+
+
+class RecipeUpdateWritesTest(FoodgramTestCase):
+    """Изменение рецепта пишет в базу только то, что изменилось."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = self.authors[0]
+        self.client.force_authenticate(self.author)
+        self.recipe = Recipe.objects.filter(author=self.author).first()
+        self.payload = {
+            'name': self.recipe.name,
+            'text': self.recipe.text,
+            'cooking_time': self.recipe.cooking_time,
+            'tags': [tag.id for tag in self.recipe.tags.all()],
+            'ingredients': [
+                {'id': item.ingredient_id, 'amount': item.amount}
+                for item in self.recipe.total_ingredients.all()
+            ],
+        }
+
+    def count_writes(self, **changes):
+        """Отправляет PATCH с изменениями и возвращает количество
+        изменяющих запросов по видам и таблицам."""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe.id}/',
+                {**self.payload, **changes}, format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+        return Counter(
+            ' '.join(match.groups())
+            for match in map(WRITE_STATEMENT.match,
+                             (query['sql'] for query in context))
+            if match
+        )
+
+    def test_text_only(self):
+        self.assertEqual(self.count_writes(text='новое описание'), {
+            'UPDATE recipes_recipe': 1,
+        })
+
+    def test_amount_change(self):
+        first, *rest = self.payload['ingredients']
+        writes = self.count_writes(
+            ingredients=[{**first, 'amount': first['amount'] + 1}, *rest]
+        )
+        self.assertEqual(writes, {
+            'UPDATE recipes_recipe': 1,
+            'UPDATE recipes_ingredientinrecipe': 1,
+        })
+
+    def test_amount_change_in_shopping_cart(self):
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+        first, *rest = self.payload['ingredients']
+        writes = self.count_writes(
+            ingredients=[{**first, 'amount': first['amount'] + 1}, *rest]
+        )
+        self.assertEqual(writes, {
+            'UPDATE recipes_recipe': 1,
+            'UPDATE recipes_ingredientinrecipe': 1,
+            'INSERT INTO jobs_job': 1,
+        })
+
+    def test_ingredient_added(self):
+        writes = self.count_writes(ingredients=[
+            *self.payload['ingredients'],
+            {'id': self.ingredients[-1].id, 'amount': 1},
+        ])
+        self.assertEqual(writes, {
+            'UPDATE recipes_recipe': 1,
+            'INSERT INTO recipes_ingredientinrecipe': 1,
+            'INSERT INTO jobs_job': 1,
+        })
+
+    def test_ingredient_removed(self):
+        writes = self.count_writes(
+            ingredients=self.payload['ingredients'][1:]
+        )
+        self.assertEqual(writes, {
+            'UPDATE recipes_recipe': 1,
+            'DELETE FROM recipes_ingredientinrecipe': 1,
+            'INSERT INTO jobs_job': 1,
+        })
+
+    def test_tags_changed(self):
+        writes = self.count_writes(tags=[self.tags[0].id, self.tags[2].id])
+        self.assertEqual(writes, {
+            'UPDATE recipes_recipe': 1,
+            'DELETE FROM recipes_recipe_tags': 1,
+            'INSERT INTO recipes_recipe_tags': 1,
+            'INSERT INTO jobs_job': 1,
+        })
+
+
+class RecipeDeleteTest(FoodgramTestCase):
+    """Фоновые задачи после удаления рецепта."""
+
+    def test_similar_recipes_refreshed(self):
+        author = self.authors[0]
+        recipe, *others = Recipe.objects.filter(author=author)
+        SimilarRecipe.objects.bulk_create(
+            SimilarRecipe(recipe=other, neighbour=recipe, score=0.5)
+            for other in others
+        )
+        self.client.force_authenticate(author)
+        response = self.client.delete(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.status_code, 204)
+        job = Job.objects.get(task=refresh_similar_recipes.task_name)
+        payload = json.loads(job.payload)
+        self.assertTrue(payload['own_only'])
+        self.assertCountEqual(payload['recipe_ids'],
+                              [other.id for other in others])
@@ -2,7 +2,8 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from .views import (AllSubscriptionViewSet, IngredientViewSet, RecipeViewSet,
-                    SubscriptionView, TagViewSet, UserView)
+                    SubscriptionView, TagViewSet, TokenCreateView,
+                    TokenDestroyView, UserView)
 
 router = DefaultRouter()
 router.register(r'ingredients', IngredientViewSet, basename='ingredients')
@@ -17,5 +18,6 @@ urlpatterns = [
     path('users/<user_id>/subscribe/', SubscriptionView.as_view(),
          name='subscribe'),
     path('', include(router.urls)),
-    path('auth/', include('djoser.urls.authtoken')),
+    path('auth/token/login/', TokenCreateView.as_view(), name='login'),
+    path('auth/token/logout/', TokenDestroyView.as_view(), name='logout'),
 ]
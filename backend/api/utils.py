@@ -1,9 +1,25 @@
-from django.db.models import F, Sum
-from django.shortcuts import HttpResponse
+import csv
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
 from rest_framework import status
 from rest_framework.response import Response
 
-from recipes.models import IngredientInRecipe
+from api.constants import (SHOPPING_CART_CHUNK_SIZE,
+                           SHOPPING_CART_FORMAT_PARAM,
+                           SHOPPING_CART_PDF_FONT_SIZE,
+                           SHOPPING_CART_PDF_MARGIN)
+from api.serializers import RecipeBatchSerializer
+from recipes.models import Recipe, ShoppingListItem, change_counter
 
 
 def post_instance(request, instance, serializer):
@@ -13,7 +29,10 @@ def post_instance(request, instance, serializer):
         context={'request': request}
     )
     serializer.is_valid(raise_exception=True)
-    serializer.save()
+    with transaction.atomic():
+        serializer.save()
+        change_counter(Recipe.objects.filter(pk=instance.id),
+                       serializer.Meta.model.recipe_counter, 1)
     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
@@ -24,31 +43,154 @@ def delete_instance(request, name_model, instance, error_message,
                                      recipe=instance).exists():
         return Response({'errors': error_message},
                         status=status.HTTP_400_BAD_REQUEST)
-    name_model.objects.filter(user=request.user, recipe=instance).delete()
+    with transaction.atomic():
+        deleted, _ = name_model.objects.filter(user=request.user,
+                                               recipe=instance).delete()
+        if deleted:
+            change_counter(Recipe.objects.filter(pk=instance.id),
+                           name_model.recipe_counter, -1)
     return Response(success_message, status=status.HTTP_204_NO_CONTENT)
 
 
-def create_shopping_cart(request):
-    """Метод создания списка покупок в формате txt."""
-    ingredients = IngredientInRecipe.objects.select_related(
-        'recipe', 'ingredient'
-    )
-    ingredients = ingredients.filter(
-        recipe__shoppingcart_related__user=request.user
-    ).values(
-        'ingredient__name',
-        'ingredient__measurement_unit'
-    ).annotate(
+@transaction.atomic
+def batch_instances(request, name_model):
+    """Пакетное добавление в избранное или в список покупок и удаление
+    из них. Возвращает ответ с результатом по каждому рецепту и
+    идентификаторы рецептов, которые действительно изменились."""
+    serializer = RecipeBatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    recipe_ids = list(dict.fromkeys(serializer.validated_data['recipes']))
+    existing = set(Recipe.objects.filter(
+        pk__in=recipe_ids
+    ).values_list('pk', flat=True))
+    linked = set(name_model.objects.filter(
+        user=request.user, recipe__in=existing
+    ).values_list('recipe', flat=True))
+    if request.method == 'POST':
+        changed = existing - linked
+        name_model.objects.bulk_create(
+            (name_model(user=request.user, recipe_id=recipe_id)
+             for recipe_id in changed),
+            ignore_conflicts=True
+        )
+        change_counter(Recipe.objects.filter(pk__in=changed),
+                       name_model.recipe_counter, 1)
+        statuses = dict.fromkeys(linked, 'already_added')
+        statuses.update(dict.fromkeys(changed, 'added'))
+    else:
+        changed = linked
+        name_model.objects.filter(
+            user=request.user, recipe__in=changed
+        ).delete()
+        change_counter(Recipe.objects.filter(pk__in=changed),
+                       name_model.recipe_counter, -1)
+        statuses = dict.fromkeys(existing - linked, 'not_added')
+        statuses.update(dict.fromkeys(changed, 'deleted'))
+    return Response({'results': [
+        {'id': recipe_id, 'status': statuses.get(recipe_id, 'not_found')}
+        for recipe_id in recipe_ids
+    ]}), changed
+
+
+class Echo:
+    """Объект-заглушка с интерфейсом файла для потоковой записи csv."""
+
+    def write(self, value):
+        return value
+
+
+def get_shopping_cart_ingredients(user):
+    """Метод получения суммарного количества ингредиентов
+    из списка покупок пользователя."""
+    return ShoppingListItem.objects.filter(user=user).values(
         name=F('ingredient__name'),
         unit=F('ingredient__measurement_unit'),
-        ingredient_amount=Sum('amount'),)
-    shopping_list = ['Список покупок:\n']
+        ingredient_amount=F('amount'),
+    ).order_by('name', 'unit')
+
+
+def shopping_cart_txt_lines(ingredients):
+    """Генератор строк списка покупок в формате txt."""
+    yield 'Список покупок:\n'
+    for ingredient in ingredients:
+        yield (f"{ingredient['name']} - {ingredient['ingredient_amount']}"
+               f"{ingredient['unit']};\n")
+
+
+def shopping_cart_csv_lines(ingredients):
+    """Генератор строк списка покупок в формате csv."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
     for ingredient in ingredients:
-        shopping_list.append(
+        yield writer.writerow((ingredient['name'],
+                               ingredient['ingredient_amount'],
+                               ingredient['unit']))
+
+
+@lru_cache(maxsize=None)
+def get_pdf_font():
+    """Регистрирует шрифт с кириллицей для pdf один раз на процесс."""
+    pdfmetrics.registerFont(TTFont('ShoppingCart',
+                                   settings.SHOPPING_CART_PDF_FONT))
+    return 'ShoppingCart'
+
+
+def shopping_cart_pdf_chunks(ingredients):
+    """Генератор списка покупок в формате pdf. Строки читаются
+    из серверного курсора, но таблица ссылок в конце pdf содержит
+    смещения всех объектов, поэтому документ отдается целиком."""
+    font = get_pdf_font()
+    margin = SHOPPING_CART_PDF_MARGIN * mm
+    line_height = SHOPPING_CART_PDF_FONT_SIZE * 1.5
+    width, height = A4
+    buffer = BytesIO()
+    pdf = Canvas(buffer, pagesize=A4)
+    pdf.setTitle('Список покупок')
+    pdf.setFont(font, SHOPPING_CART_PDF_FONT_SIZE)
+    top = height - margin
+    pdf.drawString(margin, top, 'Список покупок:')
+    position = top - line_height
+    for ingredient in ingredients:
+        if position < margin:
+            pdf.showPage()
+            pdf.setFont(font, SHOPPING_CART_PDF_FONT_SIZE)
+            position = top
+        pdf.drawString(
+            margin, position,
             f"{ingredient['name']} - {ingredient['ingredient_amount']}"
-            f"{ingredient['unit']};\n"
+            f"{ingredient['unit']}"
+        )
+        position -= line_height
+    pdf.save()
+    yield buffer.getvalue()
+
+
+SHOPPING_CART_FORMATS = {
+    'txt': (shopping_cart_txt_lines, 'text/plain; charset=utf-8'),
+    'csv': (shopping_cart_csv_lines, 'text/csv; charset=utf-8'),
+    'pdf': (shopping_cart_pdf_chunks, 'application/pdf'),
+}
+
+
+def create_shopping_cart(request):
+    """Метод создания списка покупок в формате txt, csv или pdf.
+    Строки отдаются клиенту по мере чтения из серверного курсора."""
+    file_format = request.query_params.get(
+        SHOPPING_CART_FORMAT_PARAM, 'txt'
+    )
+    if file_format not in SHOPPING_CART_FORMATS:
+        return Response(
+            {'errors': 'Доступные форматы: '
+                       f'{", ".join(SHOPPING_CART_FORMATS)}'},
+            status=status.HTTP_400_BAD_REQUEST
         )
-    response = HttpResponse(shopping_list, content_type='text/plain')
-    response['Content-Disposition'] = ('attachment; '
-                                       'filename="shopping_cart.txt"')
+    lines, content_type = SHOPPING_CART_FORMATS[file_format]
+    ingredients = get_shopping_cart_ingredients(request.user).iterator(
+        chunk_size=SHOPPING_CART_CHUNK_SIZE
+    )
+    response = StreamingHttpResponse(lines(ingredients),
+                                     content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping_cart.{file_format}"'
+    )
     return response
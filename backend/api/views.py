@@ -1,12 +1,21 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (BooleanField, F, Prefetch, Value,
+                              prefetch_related_objects)
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
+from djoser import views as djoser_views
 from djoser.views import UserViewSet
 from rest_framework import mixins, permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import Token
 
-from api.filters import IngredientFilter, RecipeFilter
+from api.authentication import issue_access_token, revoke_token
+from api.filters import RecipeFilter, RecipeOrderingFilter
+from api.ingredient_index import ingredient_index
+from api.mixins import CatalogConditionalMixin
 from api.permissions import IsSuperUserAdminAuthorOrReadOnly
 from api.serializers import (FavoriteSerializer, IngredientSerializer,
                              RecipeCreateSerializer, RecipeSerializer,
@@ -14,28 +23,55 @@ from api.serializers import (FavoriteSerializer, IngredientSerializer,
                              SubscriptionCreateSerializer,
                              SubscriptionSerializer, TagSerializer,
                              UserCreateSerializer)
-from api.utils import create_shopping_cart, delete_instance, post_instance
-from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
-                            Subscription, Tag)
+from api.utils import (batch_instances, create_shopping_cart, delete_instance,
+                       post_instance)
+from jobs.models import Job
+from recipes.constants import SIMILAR_RECIPES_COUNT
+from recipes.models import (CatalogVersion, Favorite, FeedEntry, Ingredient,
+                            IngredientInRecipe, Recipe, ShoppingCart,
+                            ShoppingListItem, SimilarRecipe, Subscription, Tag,
+                            change_counter)
+from recipes.tasks import refresh_shopping_lists, refresh_similar_recipes
 from users.models import User
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CatalogConditionalMixin,
+                        viewsets.ReadOnlyModelViewSet):
     """Вьюсет для обьектов класса Ingredient."""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
     permission_classes = [permissions.AllowAny]
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientFilter
+    catalog_name = CatalogVersion.INGREDIENTS
 
+    def list(self, request, *args, **kwargs):
+        """Метод получения ингредиентов, при наличии параметра name -
+        поиск по названию через индекс в памяти."""
+        if not request.query_params.get('name'):
+            return super().list(request, *args, **kwargs)
+        return self.conditional_response(request, self.search)
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+    def search(self, request):
+        """Метод поиска ингредиентов по названию через индекс в памяти.
+        Сначала возвращаются совпадения по началу названия, затем по
+        подстроке; параметр limit ограничивает количество результатов."""
+        limit = request.query_params.get('limit')
+        ingredients = ingredient_index.search(
+            request.query_params['name'],
+            self.get_catalog_version().version,
+            int(limit) if limit and limit.isdigit() else None
+        )
+        serializer = self.get_serializer(ingredients, many=True)
+        return Response(serializer.data)
+
+
+class TagViewSet(CatalogConditionalMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет для обьектов класса Tag."""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
     permission_classes = [permissions.AllowAny]
+    catalog_name = CatalogVersion.TAGS
 
 
 class UserView(UserViewSet):
@@ -44,6 +80,26 @@ class UserView(UserViewSet):
     serializer_class = UserCreateSerializer
 
 
+class TokenCreateView(djoser_views.TokenCreateView):
+    """Вход по email и паролю. При включенном JWT вместе с обычным
+    токеном выдается подписанный токен доступа."""
+
+    def _action(self, serializer):
+        response = super()._action(serializer)
+        if settings.JWT_SIGNING_KEY:
+            response.data['access'] = issue_access_token(serializer.user)
+        return response
+
+
+class TokenDestroyView(djoser_views.TokenDestroyView):
+    """Выход: удаляет обычный токен и отзывает подписанный."""
+
+    def post(self, request):
+        if isinstance(request.auth, Token):
+            revoke_token(request.auth)
+        return super().post(request)
+
+
 class SubscriptionView(APIView):
     """Вьюсет для удаления и изменениия подписок."""
     permission_classes = [IsSuperUserAdminAuthorOrReadOnly]
@@ -57,7 +113,11 @@ class SubscriptionView(APIView):
             context={'request': request}
         )
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            serializer.save()
+            change_counter(User.objects.filter(pk=author.id),
+                           'followers_count', 1)
+            FeedEntry.objects.backfill(request.user.id, author.id)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, user_id):
@@ -76,8 +136,15 @@ class SubscriptionView(APIView):
                 {'errors': 'Вы не подписаны на данного пользователя'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        Subscription.objects.get(user=request.user,
-                                 author=author).delete()
+        with transaction.atomic():
+            deleted, _ = Subscription.objects.filter(
+                user=request.user, author=author
+            ).delete()
+            if deleted:
+                change_counter(User.objects.filter(pk=author.id),
+                               'followers_count', -1)
+                FeedEntry.objects.filter(user=request.user,
+                                         author=author).delete()
         return Response('Отписка прошла успешно',
                         status=status.HTTP_204_NO_CONTENT)
 
@@ -86,22 +153,78 @@ class AllSubscriptionViewSet(mixins.ListModelMixin,
                              viewsets.GenericViewSet):
     """Вьюсет всех получения подписок."""
     serializer_class = SubscriptionSerializer
+    keyset_fields = ('subscribed_at', 'id')
 
     def get_queryset(self):
-        return User.objects.filter(following__user=self.request.user)
+        """Метод получения авторов, на которых подписан пользователь."""
+        return User.objects.filter(
+            following__user=self.request.user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()),
+            subscribed_at=F('following__created_at'),
+        )
+
+    def paginate_queryset(self, queryset):
+        """Страница авторов вместе с ограниченным списком последних
+        рецептов каждого автора, загруженным одним запросом."""
+        authors = super().paginate_queryset(queryset)
+        recipes = Recipe.objects.filter(author__in=authors)
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit and recipes_limit.isdigit():
+            recipes = recipes.latest_per_author(int(recipes_limit))
+        prefetch_related_objects(authors, Prefetch(
+            'recipes', queryset=recipes, to_attr='recipes_preview'
+        ))
+        return authors
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """Вьюсет рецептов."""
     queryset = Recipe.objects.all()
     permission_classes = [IsSuperUserAdminAuthorOrReadOnly]
-    filter_backends = [DjangoFilterBackend]
+    filter_backends = [DjangoFilterBackend, RecipeOrderingFilter]
     filterset_class = RecipeFilter
+    ordering_fields = ('pub_date', 'favorites_count', 'in_carts_count')
+    keyset_fields = ('pub_date', 'id')
+
+    def get_queryset(self):
+        """Метод получения queryset с подгрузкой связанных объектов."""
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve', 'feed', 'similar'):
+            queryset = queryset.select_related('author').with_user_flags(
+                self.request.user
+            )
+        return queryset
 
     def perform_create(self, serializer):
         """Метод добавления автора при создании рецепта."""
         serializer.save(author=self.request.user)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        """Метод удаления рецепта. Списки покупок пользователей,
+        добавивших рецепт, и похожие рецепты тех рецептов, в топе
+        которых он был, пересчитываются в фоновых задачах."""
+        user_ids = list(instance.shoppingcart_related.values_list(
+            'user', flat=True
+        ))
+        similar_ids = list(SimilarRecipe.objects.filter(
+            neighbour=instance
+        ).values_list('recipe', flat=True))
+        if user_ids:
+            ingredient_ids = list(instance.total_ingredients.values_list(
+                'ingredient', flat=True
+            ))
+        instance.delete()
+        change_counter(User.objects.filter(pk=instance.author_id),
+                       'recipes_count', -1)
+        if user_ids:
+            Job.objects.enqueue(refresh_shopping_lists, user_ids=user_ids,
+                                ingredient_ids=ingredient_ids)
+        if similar_ids:
+            Job.objects.enqueue(refresh_similar_recipes,
+                                recipe_ids=similar_ids, own_only=True)
+
     def get_serializer_class(self):
         """Метод определения сериализатора."""
         if self.action in ('create', 'update', 'partial_update'):
@@ -111,9 +234,45 @@ class RecipeViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'],
             permission_classes=[permissions.IsAuthenticated])
     def download_shopping_cart(self, request):
-        """Метод отправления txt файла со списком покупок."""
+        """Метод отправления файла со списком покупок.
+        Формат задается параметром file_format: txt (по умолчанию) или csv.
+        """
         return create_shopping_cart(request)
 
+    @action(detail=False, methods=['get'],
+            permission_classes=[permissions.IsAuthenticated])
+    def feed(self, request):
+        """Метод получения ленты рецептов авторов из подписок.
+        Страница ленты читается из FeedEntry по индексу пользователя."""
+        self.keyset_fields = ('pub_date', 'recipe_id')
+        entries = self.paginate_queryset(
+            FeedEntry.objects.filter(user=request.user)
+        )
+        recipes = self.get_queryset().in_bulk(
+            [entry.recipe_id for entry in entries]
+        )
+        serializer = self.get_serializer(
+            [recipes[entry.recipe_id] for entry in entries
+             if entry.recipe_id in recipes],
+            many=True
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk):
+        """Метод получения похожих рецептов, рассчитанных заранее
+        по составу ингредиентов и тэгам."""
+        recipe = get_object_or_404(Recipe, id=pk)
+        neighbour_ids = list(recipe.similar_recipes.values_list(
+            'neighbour', flat=True
+        )[:SIMILAR_RECIPES_COUNT])
+        recipes = self.get_queryset().in_bulk(neighbour_ids)
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in neighbour_ids if pk in recipes],
+            many=True
+        )
+        return Response(serializer.data)
+
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=[permissions.IsAuthenticated])
     def favorite(self, request, pk):
@@ -127,15 +286,48 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return delete_instance(request, Favorite, recipe, error_message,
                                success_message)
 
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='batch/favorite', url_name='batch-favorite',
+            permission_classes=[permissions.IsAuthenticated])
+    def batch_favorite(self, request):
+        """Метод пакетного добавления и удаления из избранного.
+        Принимает список идентификаторов рецептов в поле recipes."""
+        return batch_instances(request, Favorite)[0]
+
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=[permissions.IsAuthenticated])
     def shopping_cart(self, request, pk):
         """Метод добавления и удаления из списка покупок."""
         recipe = get_object_or_404(Recipe, id=pk)
-        if request.method == 'POST':
-            return post_instance(request, recipe, ShoppingCartSerialiser)
-        error_message = ('Ошибка удаления из списка покупок. '
-                         'Рецепта нет в списке покупок')
-        success_message = 'Рецепт успешно удален из списка покупок'
-        return delete_instance(request, ShoppingCart, recipe,
-                               error_message, success_message)
+        with transaction.atomic():
+            if request.method == 'POST':
+                response = post_instance(request, recipe,
+                                         ShoppingCartSerialiser)
+            else:
+                error_message = ('Ошибка удаления из списка покупок. '
+                                 'Рецепта нет в списке покупок')
+                success_message = 'Рецепт успешно удален из списка покупок'
+                response = delete_instance(request, ShoppingCart, recipe,
+                                           error_message, success_message)
+            ShoppingListItem.objects.refresh(
+                [request.user.id],
+                recipe.total_ingredients.values_list('ingredient', flat=True)
+            )
+        return response
+
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='batch/shopping_cart', url_name='batch-shopping-cart',
+            permission_classes=[permissions.IsAuthenticated])
+    def batch_shopping_cart(self, request):
+        """Метод пакетного добавления и удаления из списка покупок.
+        Принимает список идентификаторов рецептов в поле recipes."""
+        with transaction.atomic():
+            response, recipe_ids = batch_instances(request, ShoppingCart)
+            if recipe_ids:
+                ShoppingListItem.objects.refresh(
+                    [request.user.id],
+                    IngredientInRecipe.objects.filter(
+                        recipe__in=recipe_ids
+                    ).values_list('ingredient', flat=True).distinct()
+                )
+        return response
@@ -0,0 +1,46 @@
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+PRIMARY_ONLY_APPS = ('authtoken', 'jobs')
+
+_local = threading.local()
+
+
+@contextmanager
+def replica_reads():
+    """Разрешает чтение с реплик внутри блока в текущем потоке.
+    Реплика выбирается один раз на весь блок, чтобы все запросы
+    видели один и тот же снимок данных."""
+    _local.replica = random.choice(settings.DATABASE_REPLICAS)
+    try:
+        yield
+    finally:
+        _local.replica = None
+
+
+class ReplicaRouter:
+    """Роутер баз данных: запись и миграции идут в основную базу,
+    чтение внутри replica_reads() - в выбранную для блока реплику
+    из DATABASE_REPLICAS. Токены и очередь задач всегда читаются
+    из основной базы, чтобы не зависеть от задержки репликации."""
+
+    def db_for_read(self, model, **hints):
+        replica = getattr(_local, 'replica', None)
+        if (
+            replica is not None
+            and model._meta.app_label not in PRIMARY_ONLY_APPS
+        ):
+            return replica
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,95 @@
+import heapq
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter
+
+SLOW_QUERY_SQL_MAX_LENGTH = 1000
+
+_local = threading.local()
+
+
+class RequestMetrics:
+    """Метрики одного запроса: количество и время SQL-запросов,
+    самые медленные из них и время именованных этапов обработки."""
+
+    def __init__(self, slow_queries_kept):
+        self.queries = 0
+        self.db_time = 0.0
+        self.total_time = 0.0
+        self.timings = defaultdict(float)
+        self.depth = defaultdict(int)
+        self.slow_queries = []
+        self.slow_queries_kept = slow_queries_kept
+
+    def __call__(self, execute, sql, params, many, context):
+        """Обертка выполнения SQL для connection.execute_wrapper."""
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = perf_counter() - start
+            self.queries += 1
+            self.db_time += duration
+            entry = (duration, self.queries,
+                     sql[:SLOW_QUERY_SQL_MAX_LENGTH])
+            if len(self.slow_queries) < self.slow_queries_kept:
+                heapq.heappush(self.slow_queries, entry)
+            elif self.slow_queries_kept:
+                heapq.heappushpop(self.slow_queries, entry)
+
+    @contextmanager
+    def measure(self, name):
+        """Учитывает время этапа. Вложенные вызовы того же этапа
+        (например, вложенные сериализаторы) не суммируются повторно."""
+        self.depth[name] += 1
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.depth[name] -= 1
+            if not self.depth[name]:
+                self.timings[name] += perf_counter() - start
+
+    def get_slow_queries(self):
+        """Самые медленные запросы в порядке убывания времени."""
+        return [(duration, sql) for duration, _, sql in sorted(
+            self.slow_queries, reverse=True
+        )]
+
+    def server_timing(self):
+        """Значение заголовка Server-Timing."""
+        metrics = [
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"'
+        ]
+        metrics.extend(
+            f'{name};dur={duration * 1000:.1f}'
+            for name, duration in self.timings.items()
+        )
+        metrics.append(f'total;dur={self.total_time * 1000:.1f}')
+        return ', '.join(metrics)
+
+
+def start(metrics):
+    _local.metrics = metrics
+
+
+def stop():
+    _local.metrics = None
+
+
+def current():
+    """Метрики текущего запроса или None, если запрос не измеряется."""
+    return getattr(_local, 'metrics', None)
+
+
+@contextmanager
+def timed(name):
+    """Учитывает время блока в метриках текущего запроса.
+    Используется и как декоратор."""
+    metrics = current()
+    if metrics is None:
+        yield
+        return
+    with metrics.measure(name):
+        yield
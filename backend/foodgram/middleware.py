@@ -0,0 +1,125 @@
+import hashlib
+import logging
+import random
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from foodgram import instrumentation
+from foodgram.db_routers import replica_reads
+
+REPLICA_PATH_PREFIX = '/api/'
+REPLICA_SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+REPLICA_STICKY_CACHE_PREFIX = 'db:sticky:'
+
+logger = logging.getLogger('foodgram.performance')
+
+
+class PerformanceMiddleware:
+    """Измеряет количество и время SQL-запросов, время сериализации,
+    рендеринга и обработки запроса целиком.
+
+    Измеряется доля запросов PERFORMANCE_SAMPLE_RATE, а также запросы
+    с заголовком X-Server-Timing. Персоналу метрики возвращаются
+    в заголовке Server-Timing, медленные запросы пишутся в лог вместе
+    с самыми медленными SQL-запросами.
+    """
+    opt_in_header = 'HTTP_X_SERVER_TIMING'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not (request.META.get(self.opt_in_header)
+                or random.random() < settings.PERFORMANCE_SAMPLE_RATE):
+            return self.get_response(request)
+        metrics = instrumentation.RequestMetrics(
+            settings.PERFORMANCE_SLOW_QUERIES_LOGGED
+        )
+        instrumentation.start(metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                start = perf_counter()
+                response = self.get_response(request)
+                metrics.total_time = perf_counter() - start
+        finally:
+            instrumentation.stop()
+        user = getattr(request, 'user', None)
+        if settings.PERFORMANCE_SERVER_TIMING_PUBLIC or (
+            user is not None and user.is_staff
+        ):
+            response['Server-Timing'] = metrics.server_timing()
+        if self.is_slow(metrics):
+            self.log_slow_request(request, response, metrics)
+        return response
+
+    def process_template_response(self, request, response):
+        """Учитывает время рендеринга ответа DRF."""
+        metrics = instrumentation.current()
+        if metrics is not None:
+            start = perf_counter()
+
+            def finish_render(response):
+                metrics.timings['render'] += perf_counter() - start
+            response.add_post_render_callback(finish_render)
+        return response
+
+    def is_slow(self, metrics):
+        return (
+            metrics.total_time * 1000 >= settings.PERFORMANCE_SLOW_REQUEST_MS
+            or metrics.queries >= settings.PERFORMANCE_SLOW_REQUEST_QUERIES
+        )
+
+    def log_slow_request(self, request, response, metrics):
+        slow_queries = '\n'.join(
+            f'  {duration * 1000:.1f} ms: {sql}'
+            for duration, sql in metrics.get_slow_queries()
+        )
+        logger.warning(
+            'Медленный запрос %s %s: %s, %.1f ms, %d SQL-запросов '
+            '(%.1f ms)\n%s',
+            request.method, request.get_full_path(), response.status_code,
+            metrics.total_time * 1000, metrics.queries,
+            metrics.db_time * 1000, slow_queries
+        )
+
+
+class ReplicaRoutingMiddleware:
+    """Направляет чтение безопасных запросов к API на реплики.
+
+    После изменяющего запроса клиент на DATABASE_REPLICA_STICKY_SECONDS
+    закрепляется за основной базой, чтобы сразу видеть свои изменения.
+    Клиент определяется по заголовку Authorization.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not (settings.DATABASE_REPLICAS
+                and request.path.startswith(REPLICA_PATH_PREFIX)):
+            return self.get_response(request)
+        sticky_key = self.get_sticky_key(request)
+        if request.method not in REPLICA_SAFE_METHODS:
+            response = self.get_response(request)
+            if sticky_key is not None:
+                cache.set(sticky_key, True,
+                          settings.DATABASE_REPLICA_STICKY_SECONDS)
+            return response
+        if sticky_key is not None and cache.get(sticky_key):
+            return self.get_response(request)
+        with replica_reads():
+            return self.get_response(request)
+
+    def get_sticky_key(self, request):
+        authorization = request.META.get('HTTP_AUTHORIZATION')
+        if not authorization:
+            return None
+        return REPLICA_STICKY_CACHE_PREFIX + hashlib.sha256(
+            authorization.encode()
+        ).hexdigest()
@@ -1,6 +1,8 @@
 import os
+from datetime import timedelta
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
 from django.core.management.utils import get_random_secret_key
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -23,17 +25,21 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'colorfield',
     'django_filters',
     'djoser',
     'users.apps.UsersConfig',
+    'jobs.apps.JobsConfig',
     'recipes.apps.RecipesConfig',
     'api.apps.ApiConfig'
 ]
 
 MIDDLEWARE = [
+    'foodgram.middleware.PerformanceMiddleware',
+    'foodgram.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,6 +81,52 @@ DATABASES = {
     }
 }
 
+DATABASE_REPLICAS = []
+
+for index, replica in enumerate(
+    filter(None, os.getenv('DB_REPLICAS', '').split(','))
+):
+    address, _, name = replica.strip().partition('/')
+    host, _, port = address.partition(':')
+    alias = f'replica{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host or DATABASES['default']['HOST'],
+        'PORT': port or DATABASES['default']['PORT'],
+        'NAME': name or DATABASES['default']['NAME'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['foodgram.db_routers.ReplicaRouter']
+
+DATABASE_REPLICA_STICKY_SECONDS = int(
+    os.getenv('DB_REPLICA_STICKY_SECONDS', 5)
+)
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Кэши, которые не видны другим процессам gunicorn.
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+if (DATABASE_REPLICAS
+        and CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHE_BACKENDS):
+    raise ImproperlyConfigured(
+        'DB_REPLICAS требует общего для всех процессов кэша '
+        '(CACHE_BACKEND и CACHE_LOCATION): в нем хранится закрепление '
+        'клиента за основной базой после изменяющего запроса.'
+    )
+
 AUTH_USER_MODEL = 'users.User'
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -100,10 +152,31 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.FoodgramPagination',
     'PAGE_SIZE': 6,
 }
 
+JWT_SIGNING_KEY = os.getenv('JWT_SIGNING_KEY')
+
+if JWT_SIGNING_KEY:
+    if CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHE_BACKENDS:
+        raise ImproperlyConfigured(
+            'JWT_SIGNING_KEY требует общего для всех процессов кэша '
+            '(CACHE_BACKEND и CACHE_LOCATION): в нем хранятся отозванные '
+            'при выходе токены.'
+        )
+    REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES'].insert(
+        0, 'api.authentication.ClaimsJWTAuthentication'
+    )
+
+SIMPLE_JWT = {
+    'SIGNING_KEY': JWT_SIGNING_KEY or SECRET_KEY,
+    'ACCESS_TOKEN_LIFETIME': timedelta(
+        minutes=int(os.getenv('JWT_ACCESS_TOKEN_LIFETIME_MINUTES', 15))
+    ),
+    'AUTH_HEADER_TYPES': ('Bearer',),
+}
+
 
 DJOSER = {
     'LOGIN_FIELD': 'email',
@@ -137,4 +210,23 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
 SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
+
+PERFORMANCE_SAMPLE_RATE = float(os.getenv('PERFORMANCE_SAMPLE_RATE', 0))
+
+PERFORMANCE_SERVER_TIMING_PUBLIC = (
+    os.getenv('PERFORMANCE_SERVER_TIMING_PUBLIC', '') == 'True'
+)
+
+PERFORMANCE_SLOW_REQUEST_MS = int(os.getenv('PERFORMANCE_SLOW_REQUEST_MS', 500))
+
+PERFORMANCE_SLOW_REQUEST_QUERIES = int(
+    os.getenv('PERFORMANCE_SLOW_REQUEST_QUERIES', 50)
+)
+
+PERFORMANCE_SLOW_QUERIES_LOGGED = 5
@@ -0,0 +1,26 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """Модель для отображения админ-зоны фоновых задач."""
+    list_display = (
+        'task',
+        'status',
+        'attempts',
+        'run_after',
+        'created_at'
+    )
+    list_filter = ('status', 'task')
+    readonly_fields = ('created_at',)
+    actions = ('retry',)
+
+    def retry(self, request, queryset):
+        """Возвращает выбранные задачи в очередь."""
+        queryset.update(status=Job.QUEUED, attempts=0, locked_until=None,
+                        run_after=timezone.now())
+
+    retry.short_description = 'Повторить выбранные задачи'
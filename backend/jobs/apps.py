@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class JobsConfig(AppConfig):
+    """Класс конфигурации приложения jobs."""
+    name = 'jobs'
+
+    def ready(self):
+        autodiscover_modules('tasks')
@@ -0,0 +1,7 @@
+JOB_MAX_ATTEMPTS = 5
+JOB_POLL_INTERVAL = 1
+JOB_RETRY_DELAY = 30
+JOB_STATUS_MAX_LENGTH = 20
+JOB_TASK_MAX_LENGTH = 200
+JOB_VISIBILITY_TIMEOUT = 300
+JOB_WORKERS = 2
@@ -0,0 +1,66 @@
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management import BaseCommand
+
+from jobs.constants import (JOB_POLL_INTERVAL, JOB_VISIBILITY_TIMEOUT,
+                            JOB_WORKERS)
+from jobs.models import Job
+from jobs.worker import execute
+
+
+class Command(BaseCommand):
+    """
+    Management-команда, обрабатывающая очередь фоновых задач.
+    python manage.py run_workers --workers 4
+    """
+    help = 'Обработка очереди фоновых задач'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=JOB_WORKERS,
+                            help='Количество потоков-обработчиков')
+        parser.add_argument('--poll-interval', type=float,
+                            default=JOB_POLL_INTERVAL,
+                            help='Пауза между опросами пустой очереди, с')
+        parser.add_argument('--timeout', type=int,
+                            default=JOB_VISIBILITY_TIMEOUT,
+                            help='Время, на которое задача скрывается '
+                                 'от других воркеров, с')
+        parser.add_argument('--once', action='store_true',
+                            help='Завершиться, когда очередь опустеет')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        workers = options['workers']
+        processed = 0
+        running = set()
+        with ThreadPoolExecutor(max_workers=workers,
+                                thread_name_prefix='jobs') as executor:
+            while not self.stopping:
+                jobs = []
+                if len(running) < workers:
+                    jobs = Job.objects.claim(workers - len(running),
+                                             options['timeout'])
+                running.update(executor.submit(execute, job) for job in jobs)
+                processed += len(jobs)
+                if not running:
+                    if options['once'] and not jobs:
+                        break
+                    if not jobs:
+                        time.sleep(options['poll_interval'])
+                    continue
+                done, running = wait(
+                    running, timeout=0 if jobs else options['poll_interval'],
+                    return_when=FIRST_COMPLETED
+                )
+            wait(running)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано задач: {processed}'
+        ))
+
+    def stop(self, signum, frame):
+        """Прекращает забирать новые задачи и дожидается текущих."""
+        self.stopping = True
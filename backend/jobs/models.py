@@ -0,0 +1,150 @@
+import json
+from datetime import timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from jobs.constants import (JOB_MAX_ATTEMPTS, JOB_RETRY_DELAY,
+                            JOB_STATUS_MAX_LENGTH, JOB_TASK_MAX_LENGTH,
+                            JOB_VISIBILITY_TIMEOUT)
+from jobs.registry import get_task
+
+
+class JobQuerySet(models.QuerySet):
+    """QuerySet очереди фоновых задач."""
+
+    def enqueue(self, task, run_after=None, **payload):
+        """Ставит задачу в очередь. Задача фиксируется вместе с текущей
+        транзакцией, поэтому обработчик увидит уже сохраненные данные."""
+        get_task(task.task_name)
+        return self.create(
+            task=task.task_name,
+            payload=json.dumps(payload, cls=DjangoJSONEncoder),
+            run_after=run_after or timezone.now()
+        )
+
+    def ready(self):
+        """Задачи, которые можно взять в работу: ожидающие своего времени
+        и взятые воркером, который не успел их завершить."""
+        now = timezone.now()
+        return self.filter(
+            models.Q(status=Job.QUEUED, run_after__lte=now)
+            | models.Q(status=Job.RUNNING, locked_until__lt=now)
+        )
+
+    def claim(self, limit, timeout=JOB_VISIBILITY_TIMEOUT):
+        """Забирает до limit задач и скрывает их от других воркеров
+        на timeout секунд."""
+        lock = {}
+        if connection.features.has_select_for_update_skip_locked:
+            lock['skip_locked'] = True
+        locked_until = timezone.now() + timedelta(seconds=timeout)
+        claimed = []
+        with transaction.atomic():
+            candidates = self.ready().select_for_update(**lock).order_by(
+                'run_after', 'pk'
+            )[:limit]
+            for job in candidates:
+                if self.filter(
+                    pk=job.pk, status=job.status, attempts=job.attempts
+                ).update(
+                    status=Job.RUNNING,
+                    attempts=models.F('attempts') + 1,
+                    locked_until=locked_until
+                ):
+                    job.status = Job.RUNNING
+                    job.attempts += 1
+                    job.locked_until = locked_until
+                    claimed.append(job)
+        return claimed
+
+
+class Job(models.Model):
+    """Модель фоновой задачи. Очередь хранится в основной базе данных
+    и обрабатывается командой run_workers."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Ошибка'),
+    )
+
+    task = models.CharField(
+        'Задача',
+        max_length=JOB_TASK_MAX_LENGTH
+    )
+    payload = models.TextField(
+        'Аргументы',
+        default='{}'
+    )
+    status = models.CharField(
+        'Статус',
+        max_length=JOB_STATUS_MAX_LENGTH,
+        choices=STATUS_CHOICES,
+        default=QUEUED
+    )
+    attempts = models.PositiveSmallIntegerField(
+        'Попытки',
+        default=0
+    )
+    max_attempts = models.PositiveSmallIntegerField(
+        'Максимум попыток',
+        default=JOB_MAX_ATTEMPTS
+    )
+    run_after = models.DateTimeField(
+        'Запуск не раньше',
+        default=timezone.now
+    )
+    locked_until = models.DateTimeField(
+        'Скрыта от воркеров до',
+        null=True,
+        blank=True
+    )
+    last_error = models.TextField(
+        'Последняя ошибка',
+        blank=True
+    )
+    created_at = models.DateTimeField(
+        'Дата создания',
+        auto_now_add=True
+    )
+
+    objects = JobQuerySet.as_manager()
+
+    class Meta:
+        ordering = ('run_after', 'id')
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [
+            models.Index(fields=['status', 'run_after'],
+                         name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.task} #{self.pk}'
+
+    def run(self):
+        """Выполняет задачу с сохраненными аргументами."""
+        get_task(self.task)(**json.loads(self.payload))
+
+    def complete(self):
+        """Удаляет выполненную задачу, если ее не забрал другой воркер."""
+        Job.objects.filter(pk=self.pk, attempts=self.attempts).delete()
+
+    def fail(self, error):
+        """Возвращает задачу в очередь с экспоненциальной задержкой
+        или помечает ее как проваленную после последней попытки."""
+        if self.attempts >= self.max_attempts:
+            status, run_after = Job.FAILED, self.run_after
+        else:
+            status = Job.QUEUED
+            run_after = timezone.now() + timedelta(
+                seconds=JOB_RETRY_DELAY * 2 ** (self.attempts - 1)
+            )
+        Job.objects.filter(pk=self.pk, attempts=self.attempts).update(
+            status=status, run_after=run_after, locked_until=None,
+            last_error=error
+        )
@@ -0,0 +1,17 @@
+tasks = {}
+
+
+def task(func):
+    """Декоратор, регистрирующий функцию как фоновую задачу.
+    Задачи ищутся в модулях tasks.py установленных приложений."""
+    func.task_name = f'{func.__module__}.{func.__name__}'
+    tasks[func.task_name] = func
+    return func
+
+
+def get_task(name):
+    """Возвращает зарегистрированную задачу по имени."""
+    try:
+        return tasks[name]
+    except KeyError:
+        raise LookupError(f'Задача {name} не зарегистрирована')
@@ -0,0 +1,23 @@
+import logging
+import traceback
+
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+def execute(job):
+    """Выполняет задачу в потоке воркера. Ошибка не прерывает воркер,
+    а возвращает задачу в очередь для повторной попытки."""
+    try:
+        if job.attempts > job.max_attempts:
+            job.fail('Превышено время выполнения задачи')
+            return
+        job.run()
+    except Exception:
+        logger.exception('Ошибка выполнения задачи %s', job)
+        job.fail(traceback.format_exc())
+    else:
+        job.complete()
+    finally:
+        connection.close()
@@ -1,14 +1,53 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import PAGE_VAR
+from django.db.models import Q
 from django_admin_display import admin_display
 
 from .models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
                      ShoppingCart, Subscription, Tag)
 
 
+class InputFilter(admin.SimpleListFilter):
+    """Фильтр с полем ввода вместо списка всех значений.
+    Подходит для полей с большим количеством различных значений."""
+    template = 'admin/input_filter.html'
+
+    def lookups(self, request, model_admin):
+        return ((None, None),)
+
+    def choices(self, changelist):
+        yield {
+            'query_parts': [
+                (key, value) for key, value in changelist.params.items()
+                if key not in (self.parameter_name, PAGE_VAR)
+            ]
+        }
+
+
+class AuthorFilter(InputFilter):
+    """Фильтр рецептов по юзернейму или почте автора."""
+    title = 'автору'
+    parameter_name = 'author'
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(
+                Q(author__username=self.value())
+                | Q(author__email=self.value())
+            )
+        return queryset
+
+
 class IngredientInRecipeInline(admin.TabularInline):
     """Настройка отображения модели IngredientInRecipe."""
     model = IngredientInRecipe
     extra = 0
+    autocomplete_fields = ('ingredient',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'recipe', 'ingredient'
+        )
 
 
 @admin.register(Recipe)
@@ -19,13 +58,22 @@ class RecipeAdmin(admin.ModelAdmin):
         'name',
         'count_favorites'
     )
-    list_filter = ('author', 'name', 'tags')
+    list_filter = (AuthorFilter, 'tags')
+    list_select_related = ('author',)
+    search_fields = ('name',)
+    autocomplete_fields = ('author',)
+    show_full_result_count = False
     inlines = (IngredientInRecipeInline,)
 
-    @admin_display(short_description='Количество добавлений в избранное',)
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        Recipe.objects.filter(pk=form.instance.pk).refresh_ingredient_ids()
+
+    @admin_display(short_description='Количество добавлений в избранное',
+                   admin_order_field='favorites_count')
     def count_favorites(self, obj):
-        """"Метод подсчета количества добавлений в избранное."""
-        return Favorite.objects.filter(recipe=obj).count()
+        """"Метод вывода количества добавлений в избранное."""
+        return obj.favorites_count
 
 
 @admin.register(Ingredient)
@@ -35,12 +83,50 @@ class IngredientAdmin(admin.ModelAdmin):
         'name',
         'measurement_unit'
     )
-    list_filter = ('name',)
     search_fields = ('name',)
+    ordering = ('name',)
+    show_full_result_count = False
+
+
+@admin.register(IngredientInRecipe)
+class IngredientInRecipeAdmin(admin.ModelAdmin):
+    """Модель для отображения админ-зоны ингредиентов в рецептах."""
+    list_select_related = ('recipe', 'ingredient')
+    autocomplete_fields = ('recipe', 'ingredient')
+    show_full_result_count = False
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        Recipe.objects.filter(
+            pk__in={obj.recipe_id, form.initial.get('recipe')}
+        ).refresh_ingredient_ids()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        Recipe.objects.filter(pk=obj.recipe_id).refresh_ingredient_ids()
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = list(queryset.values_list('recipe', flat=True))
+        super().delete_queryset(request, queryset)
+        Recipe.objects.filter(pk__in=recipe_ids).refresh_ingredient_ids()
+
+
+@admin.register(Favorite, ShoppingCart)
+class FavShopCartAdmin(admin.ModelAdmin):
+    """Модель для отображения админ-зоны избранного и списков покупок."""
+    list_display = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
+    show_full_result_count = False
+
+
+@admin.register(Subscription)
+class SubscriptionAdmin(admin.ModelAdmin):
+    """Модель для отображения админ-зоны подписок."""
+    list_display = ('user', 'author')
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    show_full_result_count = False
 
 
-admin.site.register(Subscription)
-admin.site.register(Favorite)
 admin.site.register(Tag)
-admin.site.register(IngredientInRecipe)
-admin.site.register(ShoppingCart)
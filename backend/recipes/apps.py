@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models import CharField, TextField
 
 
 class RecipesConfig(AppConfig):
     """Класс конфигурации приложения recipes."""
     name = 'recipes'
+
+    def ready(self):
+        import recipes.signals  # noqa: F401
+        from recipes.lookups import TrigramWordSimilar
+        CharField.register_lookup(TrigramWordSimilar)
+        TextField.register_lookup(TrigramWordSimilar)
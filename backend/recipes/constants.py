@@ -1,8 +1,27 @@
+CATALOG_NAME_MAX_LENGTH = 50
+FEED_BATCH_SIZE = 1000
+FEED_MAX_LENGTH = 500
 INGREDIENT_NAME_MAX_LENGTH = 200
 INGREDIENT_UNIT_MAX_LENGTH = 200
 MAX_COOKING_TIME_IN_MIN = 1440
 MAX_INGREDIENT_AMOUNT = 10000
 MIN_COOKING_TIME_IN_MIN = 1
 MIN_INGREDIENT_AMOUNT = 1
+RECIPE_IMAGE_VARIANTS = {
+    'small': (320, 320),
+    'large': (1024, 1024),
+}
+RECIPE_IMAGE_VARIANT_FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+RECIPE_IMAGE_VARIANT_QUALITY = 80
+RECIPE_IMAGE_VARIANTS_PATH = 'recipes/variants/'
 RECIPE_NAME_MAX_LENGTH = 200
+SEARCH_CONFIG = 'russian'
+SIMILAR_BLOCK_PAIRS = 2000000
+SIMILAR_COMMON_FEATURE_MIN_RECIPES = 100
+SIMILAR_COMMON_FEATURE_SHARE = 0.05
+SIMILAR_RECIPES_COUNT = 10
+SIMILAR_TAG_WEIGHT = 0.1
 TAG_NAME_MAX_LENGTH = 200
@@ -0,0 +1,62 @@
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from recipes.constants import (RECIPE_IMAGE_VARIANT_FORMATS,
+                               RECIPE_IMAGE_VARIANT_QUALITY,
+                               RECIPE_IMAGE_VARIANTS)
+from recipes.models import Recipe
+
+
+def flatten(image):
+    """Накладывает картинку с прозрачностью на белый фон для форматов
+    без альфа-канала."""
+    if image.mode != 'RGBA':
+        return image
+    background = Image.new('RGB', image.size, 'white')
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def build_image_variants(recipe_id):
+    """Строит уменьшенные варианты картинки рецепта в форматах WebP
+    и JPEG. Варианты сохраняются, только если картинка рецепта
+    не сменилась за время обработки, после чего файлы вариантов
+    прежней картинки удаляются."""
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not recipe.image or recipe.has_image_variants():
+        return
+    storage = recipe.image.storage
+    previous = {
+        getattr(recipe, field).name
+        for field in recipe.get_image_variant_names()
+    }
+    with recipe.image.open('rb') as file, Image.open(file) as original:
+        original = ImageOps.exif_transpose(original)
+        mode = 'RGBA' if 'A' in original.getbands() else 'RGB'
+        original = original.convert(mode)
+        variants = {}
+        for size, dimensions in RECIPE_IMAGE_VARIANTS.items():
+            variant = original.copy()
+            variant.thumbnail(dimensions, Image.LANCZOS)
+            for image_format, codec in RECIPE_IMAGE_VARIANT_FORMATS.items():
+                buffer = BytesIO()
+                image = variant if codec == 'WEBP' else flatten(variant)
+                image.save(buffer, codec,
+                           quality=RECIPE_IMAGE_VARIANT_QUALITY)
+                name = recipe.get_image_variant_name(size, image_format)
+                storage.delete(name)
+                variants[recipe.get_image_variant_field(
+                    size, image_format
+                )] = storage.save(name, ContentFile(buffer.getvalue()))
+    built = set(variants.values())
+    if Recipe.objects.filter(
+        pk=recipe_id, image=recipe.image.name
+    ).bump_version(**variants):
+        stale = previous - built
+    else:
+        # Картинка сменилась за время обработки: варианты не нужны.
+        stale = built
+    for name in stale - {''}:
+        storage.delete(name)
@@ -0,0 +1,22 @@
+from django.contrib.postgres.lookups import PostgresSimpleLookup
+from django.db.models import FloatField, Func, Value
+
+
+class TrigramWordSimilar(PostgresSimpleLookup):
+    """Поиск строки, похожей на одно из слов поля: field %> value.
+    Обслуживается GIN-индексом gin_trgm_ops, в Django есть с версии 3.2.
+    """
+    lookup_name = 'trigram_word_similar'
+    operator = '%%>'
+
+
+class TrigramWordSimilarity(Func):
+    """Схожесть строки с наиболее похожим отрезком значения поля
+    (WORD_SIMILARITY из pg_trgm), в Django есть с версии 4.0."""
+    function = 'WORD_SIMILARITY'
+    output_field = FloatField()
+
+    def __init__(self, string, expression, **extra):
+        if not hasattr(string, 'resolve_expression'):
+            string = Value(string)
+        super().__init__(string, expression, **extra)
@@ -0,0 +1,25 @@
+from django.core.management import BaseCommand
+
+from recipes.images import build_image_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """
+    Management-команда, строящая варианты картинок существующих рецептов.
+    python manage.py build_image_variants
+    """
+    help = 'Построение уменьшенных вариантов картинок рецептов'
+
+    def handle(self, *args, **options):
+        processed = 0
+        for recipe in Recipe.objects.exclude(image='').only(
+            'id', 'image', 'image_small', 'image_large', 'image_small_jpeg',
+            'image_large_jpeg'
+        ).iterator():
+            if not recipe.has_image_variants():
+                build_image_variants(recipe.id)
+                processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано рецептов: {processed}'
+        ))
@@ -0,0 +1,17 @@
+from django.core.management import BaseCommand
+
+from recipes.similarity import rebuild_similar_recipes
+
+
+class Command(BaseCommand):
+    """
+    Management-команда, пересчитывающая похожие рецепты для всех рецептов.
+    python manage.py build_similar_recipes
+    """
+    help = 'Пересчет таблицы похожих рецептов'
+
+    def handle(self, *args, **options):
+        saved = rebuild_similar_recipes()
+        self.stdout.write(self.style.SUCCESS(
+            f'Сохранено пар похожих рецептов: {saved}'
+        ))
@@ -0,0 +1,337 @@
+import random
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from io import StringIO
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError, call_command
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from recipes.management.commands.import_csv import escape_copy
+from recipes.models import (Favorite, FeedEntry, Ingredient,
+                            IngredientInRecipe, Recipe, ShoppingCart,
+                            ShoppingListItem, Subscription, Tag)
+from users.models import User
+
+WORDS = ('курица', 'суп', 'салат', 'пирог', 'каша', 'рыба', 'соус',
+         'блины', 'овощи', 'грибы', 'сыр', 'яблоко', 'тесто', 'рис')
+FIRST_NAMES = ('Анна', 'Иван', 'Мария', 'Петр', 'Ольга', 'Сергей',
+               'Елена', 'Дмитрий', 'Наталья', 'Алексей')
+LAST_NAMES = ('Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов',
+              'Лебедев', 'Козлов', 'Новиков', 'Морозов', 'Волков')
+AUTHOR_EXPONENT = 0.8
+POPULARITY_EXPONENT = 0.8
+INGREDIENT_EXPONENT = 0.6
+PER_USER_PARETO_ALPHA = 2
+RECIPE_INGREDIENTS = (3, 12)
+RECIPE_TAGS = (1, 3)
+RECIPE_TEXT_WORDS = (10, 40)
+RECIPE_IMAGE = 'recipes/generated.png'
+DATE_RANGE_DAYS = 365
+GENERATED_MODELS = (Subscription, Favorite, ShoppingCart, Recipe.tags.through,
+                    IngredientInRecipe, Recipe, ShoppingListItem, FeedEntry)
+
+
+def zipf_cum_weights(count, exponent):
+    """Накопленные веса степенного распределения: элемент с рангом r
+    выбирается с вероятностью, пропорциональной 1 / r ** exponent."""
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, count + 1)
+    ))
+
+
+def to_copy(value):
+    """Представление значения в текстовом формате COPY."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, str):
+        return escape_copy(value)
+    if isinstance(value, list):
+        return '{' + ','.join(map(str, value)) + '}'
+    return str(value)
+
+
+@contextmanager
+def foreign_keys_postponed(models):
+    """В PostgreSQL снимает внешние ключи таблиц на время загрузки
+    и создает их заново: одна проверка при создании ограничения
+    быстрее построчной проверки миллионов вставленных строк.
+    При ошибке ограничения восстанавливает откат транзакции."""
+    if connection.vendor != 'postgresql':
+        yield
+        return
+    quote = connection.ops.quote_name
+    constraints = []
+    with connection.cursor() as cursor:
+        for model in models:
+            table = quote(model._meta.db_table)
+            cursor.execute(
+                'SELECT conname, pg_get_constraintdef(oid) '
+                'FROM pg_constraint '
+                "WHERE conrelid = %s::regclass AND contype = 'f'",
+                [table]
+            )
+            for name, definition in cursor.fetchall():
+                constraints.append((table, quote(name), definition))
+                cursor.execute(
+                    f'ALTER TABLE {table} DROP CONSTRAINT {quote(name)}'
+                )
+    yield
+    with connection.cursor() as cursor:
+        for table, name, definition in constraints:
+            cursor.execute(
+                f'ALTER TABLE {table} ADD CONSTRAINT {name} {definition}'
+            )
+
+
+class TableWriter:
+    """Пишет строки модели пачками: через COPY в PostgreSQL,
+    через bulk_create в остальных СУБД."""
+
+    def __init__(self, model, fields, batch_size):
+        self.model = model
+        self.fields = [model._meta.get_field(name) for name in fields]
+        self.batch_size = batch_size
+        self.rows = []
+        self.count = 0
+
+    def write(self, *row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        if connection.vendor == 'postgresql':
+            quote = connection.ops.quote_name
+            columns = ', '.join(quote(field.column) for field in self.fields)
+            with connection.cursor() as cursor:
+                cursor.copy_expert(
+                    f'COPY {quote(self.model._meta.db_table)} ({columns}) '
+                    'FROM STDIN',
+                    StringIO(''.join(
+                        '\t'.join(map(to_copy, row)) + '\n'
+                        for row in self.rows
+                    ))
+                )
+        else:
+            attnames = [field.attname for field in self.fields]
+            self.model.objects.bulk_create(
+                self.model(**dict(zip(attnames, row))) for row in self.rows
+            )
+        self.count += len(self.rows)
+        self.rows = []
+
+
+class Command(BaseCommand):
+    """
+    Management-команда, генерирующая большой детерминированный набор
+    данных: пользователей, рецепты, избранное, списки покупок, подписки
+    и ленты подписок.
+    python manage.py generate_data [--users N] [--recipes N] [--seed N]
+    Авторы и популярность рецептов распределены по степенному закону.
+    Ингредиенты загружаются из data/ingredients.csv, тэги берутся
+    из уже существующих. Все данные пишутся в одной транзакции.
+    """
+    help = 'Генерация синтетических данных для нагрузочного тестирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--favorites', type=float, default=20,
+            help='Среднее количество избранных рецептов на пользователя',
+        )
+        parser.add_argument(
+            '--carts', type=float, default=3,
+            help='Среднее количество рецептов в списке покупок',
+        )
+        parser.add_argument(
+            '--subscriptions', type=float, default=10,
+            help='Среднее количество подписок на пользователя',
+        )
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--skip-feeds', action='store_true',
+            help='Не собирать ленты подписок',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=10000,
+            help='Количество строк в одной вставке',
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь')
+        tag_ids = list(Tag.objects.order_by('pk').values_list('pk', flat=True))
+        if not tag_ids:
+            raise CommandError('Сначала добавьте тэги через админ-панель')
+        call_command('import_csv', stdout=StringIO())
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        with transaction.atomic(), foreign_keys_postponed(GENERATED_MODELS):
+            totals = self.generate(options, tag_ids)
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(
+                    no_style(), [User, Recipe]
+                ):
+                    cursor.execute(sql)
+        self.stdout.write(self.style.SUCCESS(', '.join(
+            f'{model.__name__}: {count}' for model, count in totals.items()
+        )))
+
+    def writer(self, model, *fields):
+        return TableWriter(model, fields, self.batch_size)
+
+    def per_user(self, mean, limit):
+        """Количество связей пользователя с тяжелым хвостом распределения
+        и заданным средним."""
+        alpha = PER_USER_PARETO_ALPHA
+        value = mean * (alpha - 1) / alpha * self.random.paretovariate(alpha)
+        return min(int(value), limit)
+
+    def past_date(self):
+        return self.now - timedelta(
+            seconds=self.random.randrange(DATE_RANGE_DAYS * 24 * 3600)
+        )
+
+    def generate(self, options, tag_ids):
+        """Генерирует строки. Счетчики пользователей и рецептов считаются
+        по ходу генерации, поэтому сами пользователи и рецепты пишутся
+        последними, когда счетчики уже известны."""
+        rand = self.random
+        first_user = (User.objects.aggregate(Max('pk'))['pk__max'] or 0) + 1
+        first_recipe = (
+            Recipe.objects.aggregate(Max('pk'))['pk__max'] or 0
+        ) + 1
+        user_ids = range(first_user, first_user + options['users'])
+        recipe_ids = range(first_recipe, first_recipe + options['recipes'])
+        author_weights = zipf_cum_weights(len(user_ids), AUTHOR_EXPONENT)
+        authors = rand.choices(
+            user_ids, cum_weights=author_weights, k=len(recipe_ids)
+        )
+        popular_recipes = list(recipe_ids)
+        rand.shuffle(popular_recipes)
+        popularity = zipf_cum_weights(len(recipe_ids), POPULARITY_EXPONENT)
+        ingredient_ids = list(
+            Ingredient.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        rand.shuffle(ingredient_ids)
+        ingredient_weights = zipf_cum_weights(
+            len(ingredient_ids), INGREDIENT_EXPONENT
+        )
+        totals = {}
+        followers = Counter()
+        subscriptions = self.writer(Subscription, 'user', 'author',
+                                    'created_at')
+        for user_id in user_ids:
+            for author_id in set(rand.choices(
+                user_ids, cum_weights=author_weights,
+                k=self.per_user(options['subscriptions'], len(user_ids))
+            )) - {user_id}:
+                followers[author_id] += 1
+                subscriptions.write(user_id, author_id, self.past_date())
+        subscriptions.flush()
+        totals[Subscription] = subscriptions.count
+        counters = {}
+        for model, mean in ((Favorite, options['favorites']),
+                            (ShoppingCart, options['carts'])):
+            counter = counters[model] = Counter()
+            writer = self.writer(model, 'user', 'recipe')
+            if recipe_ids:
+                for user_id in user_ids:
+                    for recipe_id in set(rand.choices(
+                        popular_recipes, cum_weights=popularity,
+                        k=self.per_user(mean, len(recipe_ids))
+                    )):
+                        counter[recipe_id] += 1
+                        writer.write(user_id, recipe_id)
+            writer.flush()
+            totals[model] = writer.count
+        tags = self.writer(Recipe.tags.through, 'recipe', 'tag')
+        ingredients = self.writer(IngredientInRecipe, 'recipe', 'ingredient',
+                                  'amount')
+        recipes = self.writer(
+            Recipe, 'id', 'author', 'name', 'text', 'pub_date', 'image',
+            'image_small', 'image_large', 'image_small_jpeg',
+            'image_large_jpeg', 'cooking_time', 'version',
+            'favorites_count', 'in_carts_count', 'ingredient_ids'
+        )
+        for recipe_id, author_id in zip(recipe_ids, authors):
+            for tag_id in rand.sample(
+                tag_ids, min(rand.randint(*RECIPE_TAGS), len(tag_ids))
+            ):
+                tags.write(recipe_id, tag_id)
+            composition = sorted(set(rand.choices(
+                ingredient_ids, cum_weights=ingredient_weights,
+                k=rand.randint(*RECIPE_INGREDIENTS)
+            )))
+            for ingredient_id in composition:
+                ingredients.write(recipe_id, ingredient_id,
+                                  rand.randint(1, 500))
+            recipes.write(
+                recipe_id, author_id, ' '.join(rand.sample(WORDS, 2)),
+                ' '.join(rand.choices(
+                    WORDS, k=rand.randint(*RECIPE_TEXT_WORDS)
+                )),
+                self.past_date(), RECIPE_IMAGE, '', '', '', '',
+                rand.randint(5, 180), 1,
+                counters[Favorite][recipe_id],
+                counters[ShoppingCart][recipe_id], composition
+            )
+        for writer in (tags, ingredients, recipes):
+            writer.flush()
+        totals[Recipe.tags.through] = tags.count
+        totals[IngredientInRecipe] = ingredients.count
+        totals[Recipe] = recipes.count
+        recipes_count = Counter(authors)
+        password = make_password(None)
+        users = self.writer(
+            User, 'id', 'password', 'is_superuser', 'username', 'first_name',
+            'last_name', 'email', 'is_staff', 'is_active', 'date_joined',
+            'recipes_count', 'followers_count'
+        )
+        for user_id in user_ids:
+            users.write(
+                user_id, password, False, f'generated{user_id}',
+                rand.choice(FIRST_NAMES), rand.choice(LAST_NAMES),
+                f'generated{user_id}@example.com', False, True,
+                self.past_date(), recipes_count[user_id], followers[user_id]
+            )
+        users.flush()
+        totals[User] = users.count
+        totals[ShoppingListItem] = self.fill_shopping_lists(first_user)
+        if not options['skip_feeds']:
+            totals[FeedEntry] = FeedEntry.objects.rebuild(
+                User.objects.filter(pk__gte=first_user)
+            )
+        return totals
+
+    def fill_shopping_lists(self, first_user):
+        """Заполняет агрегированные списки покупок сгенерированных
+        пользователей одним запросом INSERT ... SELECT."""
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote(ShoppingListItem._meta.db_table)} '
+                '(user_id, ingredient_id, amount) '
+                'SELECT cart.user_id, item.ingredient_id, SUM(item.amount) '
+                f'FROM {quote(ShoppingCart._meta.db_table)} cart '
+                f'JOIN {quote(IngredientInRecipe._meta.db_table)} item '
+                'ON item.recipe_id = cart.recipe_id '
+                'WHERE cart.user_id >= %s '
+                'GROUP BY cart.user_id, item.ingredient_id',
+                [first_user]
+            )
+            return cursor.rowcount
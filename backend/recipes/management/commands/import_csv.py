@@ -1,25 +1,175 @@
 import csv
+import json
 import os
+from io import StringIO
+from itertools import islice
 
 from django.conf import settings
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
 
-from recipes.models import Ingredient
+from recipes.constants import (INGREDIENT_NAME_MAX_LENGTH,
+                               INGREDIENT_UNIT_MAX_LENGTH)
+from recipes.models import CatalogVersion, Ingredient
+
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    """Построчно читает пары (название, единица измерения) из csv."""
+    for row in csv.reader(file, delimiter=','):
+        if len(row) >= 2:
+            yield row[0], row[1]
+        else:
+            yield None
+
+
+def read_json(file):
+    """Потоково читает объекты из JSON-массива, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    while True:
+        chunk = file.read(JSON_CHUNK_SIZE)
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and position < len(buffer):
+                if buffer[position] != '[':
+                    raise CommandError('Ожидался JSON-массив ингредиентов')
+                started = True
+                position += 1
+                continue
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                break
+            if isinstance(item, dict):
+                yield item.get('name'), item.get('measurement_unit')
+            else:
+                yield None
+        buffer = buffer[position:]
+        if not chunk:
+            if buffer.strip():
+                raise CommandError('Некорректный JSON в конце файла')
+            return
+
+
+def escape_copy(value):
+    """Экранирует значение для текстового формата COPY."""
+    return (value.replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
 
 
 class Command(BaseCommand):
     """
-    Management-команда, добавляющая данные в базу данных.
-    python manage.py import_csv
+    Management-команда, добавляющая ингредиенты в базу данных.
+    python manage.py import_csv [--path data/ingredients.json]
+    Данные читаются потоково и вставляются пачками в одной транзакции,
+    уже существующие ингредиенты пропускаются.
     """
-    help = 'Импорт данных из CSV файла в модель Ingredient'
+    help = 'Импорт ингредиентов из CSV или JSON файла в модель Ingredient'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=os.path.join(settings.BASE_DIR, 'data/ingredients.csv'),
+            help='Путь к файлу с ингредиентами',
+        )
+        parser.add_argument(
+            '--format',
+            choices=READERS,
+            help='Формат файла, по умолчанию определяется по расширению',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Количество строк в одной вставке',
+        )
 
     def handle(self, *args, **options):
-        with open(os.path.join(settings.BASE_DIR, 'data/ingredients.csv'),
-                  'rt', encoding='utf-8') as csv_file:
-            csv_reader = csv.reader(csv_file, delimiter=',')
-            for row in csv_reader:
-                Ingredient.objects.get_or_create(
-                    name=row[0],
-                    measurement_unit=row[1]
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(
+            path
+        )[1].lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        load = (self.load_with_copy if connection.vendor == 'postgresql'
+                else self.load_with_bulk_create)
+        with open(path, 'rt', encoding='utf-8') as file, \
+                transaction.atomic():
+            self.total = self.invalid = 0
+            inserted = load(self.read_batches(
+                READERS[file_format](file), options['batch_size']
+            ))
+            if inserted:
+                CatalogVersion.objects.bump(CatalogVersion.INGREDIENTS)
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано строк: {self.total}, добавлено: {inserted}, '
+            f'пропущено существующих: '
+            f'{self.total - self.invalid - inserted}, '
+            f'некорректных: {self.invalid}'
+        ))
+
+    def read_batches(self, rows, batch_size):
+        """Разбивает строки на пачки, отбрасывая некорректные."""
+        while True:
+            chunk = list(islice(rows, batch_size))
+            if not chunk:
+                return
+            batch = [
+                row for row in chunk
+                if row is not None and all(row)
+                and len(row[0]) <= INGREDIENT_NAME_MAX_LENGTH
+                and len(row[1]) <= INGREDIENT_UNIT_MAX_LENGTH
+            ]
+            self.total += len(chunk)
+            self.invalid += len(chunk) - len(batch)
+            yield batch
+
+    def load_with_bulk_create(self, batches):
+        """Вставка пачками через bulk_create с пропуском конфликтов."""
+        initial_count = Ingredient.objects.count()
+        for batch in batches:
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=name, measurement_unit=unit)
+                 for name, unit in batch),
+                ignore_conflicts=True
+            )
+        return Ingredient.objects.count() - initial_count
+
+    def load_with_copy(self, batches):
+        """Загрузка через COPY во временную таблицу и одна вставка
+        с пропуском конфликтов по unique_ingredient_unit."""
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_import '
+                '(name text, measurement_unit text) ON COMMIT DROP'
+            )
+            for batch in batches:
+                cursor.copy_expert(
+                    'COPY ingredient_import FROM STDIN',
+                    StringIO(''.join(
+                        f'{escape_copy(name)}\t{escape_copy(unit)}\n'
+                        for name, unit in batch
+                    ))
                 )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT name, measurement_unit '
+                'FROM ingredient_import '
+                'ON CONFLICT ON CONSTRAINT unique_ingredient_unit DO NOTHING'
+            )
+            return cursor.rowcount
@@ -0,0 +1,38 @@
+from django.core.management import BaseCommand
+
+from recipes.models import FeedEntry
+from users.models import User
+
+
+class Command(BaseCommand):
+    """
+    Management-команда, заново собирающая ленты подписок пользователей.
+    python manage.py rebuild_feeds [--batch-size N]
+    """
+    help = 'Пересборка лент подписок по текущим подпискам и рецептам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество пользователей, обрабатываемых за один раз',
+        )
+
+    def handle(self, *args, **options):
+        user_ids = list(User.objects.filter(
+            follower__isnull=False
+        ).distinct().order_by('pk').values_list('pk', flat=True))
+        batch_size = options['batch_size']
+        created = 0
+        for start in range(0, len(user_ids), batch_size):
+            created += FeedEntry.objects.rebuild(User.objects.filter(
+                pk__in=user_ids[start:start + batch_size]
+            ))
+        FeedEntry.objects.exclude(user__in=User.objects.filter(
+            follower__isnull=False
+        )).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересобраны ленты {len(user_ids)} пользователей, '
+            f'записей: {created}'
+        ))
@@ -0,0 +1,75 @@
+from django.core.management import BaseCommand
+from django.db.models import Q
+
+from recipes.models import ShoppingListItem
+from users.models import User
+
+
+class Command(BaseCommand):
+    """
+    Management-команда, пересчитывающая агрегированные списки покупок.
+    python manage.py rebuild_shopping_lists [--verify] [--batch-size N]
+    """
+    help = ('Пересборка или проверка агрегированных списков покупок '
+            'по текущему содержимому ShoppingCart')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сравнить агрегат с исходными данными',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество пользователей, обрабатываемых за один раз',
+        )
+
+    def handle(self, *args, **options):
+        user_ids = User.objects.filter(
+            Q(shoppingcart_related__isnull=False)
+            | Q(shopping_list_items__isnull=False)
+        ).distinct().order_by('pk').values_list('pk', flat=True)
+        batch_size = options['batch_size']
+        user_ids = list(user_ids)
+        mismatches = 0
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            if options['verify']:
+                mismatches += self.verify(batch)
+            else:
+                ShoppingListItem.objects.refresh(batch)
+        if not options['verify']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Пересчитаны списки покупок {len(user_ids)} пользователей'
+            ))
+        elif mismatches:
+            self.stdout.write(self.style.ERROR(
+                f'Найдено расхождений: {mismatches}'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS('Расхождений не найдено'))
+
+    def verify(self, user_ids):
+        """Сравнивает сохраненные строки с суммами по рецептам."""
+        expected = {
+            (row['user'], row['ingredient']): row['total']
+            for row in ShoppingListItem.objects.live_totals(user_ids)
+        }
+        stored = {
+            (row['user'], row['ingredient']): row['amount']
+            for row in ShoppingListItem.objects.filter(
+                user__in=user_ids
+            ).values('user', 'ingredient', 'amount')
+        }
+        mismatches = 0
+        for key in expected.keys() | stored.keys():
+            if expected.get(key) != stored.get(key):
+                mismatches += 1
+                self.stdout.write(
+                    f'user={key[0]} ingredient={key[1]}: '
+                    f'ожидалось {expected.get(key)}, '
+                    f'сохранено {stored.get(key)}'
+                )
+        return mismatches
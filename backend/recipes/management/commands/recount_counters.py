@@ -0,0 +1,69 @@
+from django.core.management import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart, Subscription
+from users.models import User
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscription, 'author'),
+)
+
+
+def actual_count(model, field):
+    """Подзапрос с фактическим количеством связанных строк."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values('total')
+    ), Value(0))
+
+
+class Command(BaseCommand):
+    """
+    Management-команда, сверяющая денормализованные счетчики
+    рецептов и пользователей с фактическими данными.
+    python manage.py recount_counters [--verify]
+    """
+    help = ('Пересчет счетчиков избранного, списков покупок, '
+            'рецептов и подписчиков')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только вывести расхождения, не исправляя их',
+        )
+
+    def handle(self, *args, **options):
+        mismatches = 0
+        for model, counter, related_model, field in COUNTERS:
+            stale = model.objects.annotate(
+                actual=actual_count(related_model, field)
+            ).filter(~Q(**{counter: F('actual')}))
+            if options['verify']:
+                for pk, stored, actual in stale.values_list(
+                    'pk', counter, 'actual'
+                ):
+                    self.stdout.write(
+                        f'{model._meta.model_name}={pk} {counter}: '
+                        f'ожидалось {actual}, сохранено {stored}'
+                    )
+                    mismatches += 1
+            else:
+                mismatches += model.objects.filter(
+                    pk__in=stale.values('pk')
+                ).update(**{counter: actual_count(related_model, field)})
+        if options['verify'] and mismatches:
+            self.stdout.write(self.style.ERROR(
+                f'Найдено расхождений: {mismatches}'
+            ))
+        elif options['verify']:
+            self.stdout.write(self.style.SUCCESS('Расхождений не найдено'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Исправлено счетчиков: {mismatches}'
+            ))
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.19 on 2026-10-18 01:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_auto_20261018_0134'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_large',
+            field=models.ImageField(blank=True, editable=False, upload_to='recipes/variants/', verbose_name='Большая картинка'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_small',
+            field=models.ImageField(blank=True, editable=False, upload_to='recipes/variants/', verbose_name='Уменьшенная картинка'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.19 on 2026-10-18 01:49
+
+from django.db import migrations, models
+
+
+def remove_duplicates(apps, schema_editor):
+    for name in ('Favorite', 'ShoppingCart'):
+        model = apps.get_model('recipes', name)
+        keep = model.objects.values('user', 'recipe').annotate(
+            keep=models.Min('id')
+        ).values('keep')
+        model.objects.exclude(id__in=keep).delete()
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_auto_20261018_0144'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shopping_cart'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 2.2.19 on 2026-10-18 02:13
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+FILL_FEEDS = """
+INSERT INTO recipes_feedentry (user_id, recipe_id, author_id, pub_date)
+SELECT user_id, recipe_id, author_id, pub_date FROM (
+    SELECT subscription.user_id, recipe.id AS recipe_id, recipe.author_id,
+           recipe.pub_date,
+           row_number() OVER (
+               PARTITION BY subscription.user_id
+               ORDER BY recipe.pub_date DESC, recipe.id DESC
+           ) AS position
+    FROM recipes_subscription subscription
+    JOIN recipes_recipe recipe ON recipe.author_id = subscription.author_id
+) ranked
+WHERE position <= 500;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0017_auto_20261018_0151'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации рецепта')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор рецепта')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='recipes.Recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи лент',
+                'ordering': ('-pub_date', '-recipe_id'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', '-pub_date', '-recipe'], name='feed_entry_user_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feed_entry'),
+        ),
+        migrations.RunSQL(FILL_FEEDS, migrations.RunSQL.noop),
+    ]
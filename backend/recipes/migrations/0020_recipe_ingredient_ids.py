@@ -0,0 +1,36 @@
+# Generated by Django 2.2.19 on 2026-10-18 02:46
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+FILL_INGREDIENT_IDS = """
+UPDATE recipes_recipe recipe SET ingredient_ids = composition.ingredient_ids
+FROM (
+    SELECT recipe_id, array_agg(ingredient_id ORDER BY ingredient_id)
+           AS ingredient_ids
+    FROM recipes_ingredientinrecipe
+    GROUP BY recipe_id
+) composition
+WHERE composition.recipe_id = recipe.id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0019_similarrecipe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredient_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), default=list, editable=False, help_text='Копия состава рецепта для фильтрации по GIN-индексу', size=None, verbose_name='Идентификаторы ингредиентов'),
+        ),
+        migrations.RunSQL(FILL_INGREDIENT_IDS, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['ingredient_ids'], name='recipe_ingredient_ids_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.19 on 2026-10-18 03:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0021_recipe_author_pub_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_large_jpeg',
+            field=models.ImageField(blank=True, editable=False, upload_to='recipes/variants/', verbose_name='Большая картинка в JPEG'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_small_jpeg',
+            field=models.ImageField(blank=True, editable=False, upload_to='recipes/variants/', verbose_name='Уменьшенная картинка в JPEG'),
+        ),
+    ]
@@ -1,17 +1,89 @@
+import os
+
 from colorfield.fields import ColorField
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core import validators
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models.expressions import RawSQL, Window
+from django.db.models.functions import Greatest, RowNumber
+from django.utils import timezone
 
-from recipes.constants import (INGREDIENT_NAME_MAX_LENGTH,
+from recipes.constants import (CATALOG_NAME_MAX_LENGTH, FEED_BATCH_SIZE,
+                               FEED_MAX_LENGTH, INGREDIENT_NAME_MAX_LENGTH,
                                INGREDIENT_UNIT_MAX_LENGTH,
                                MAX_COOKING_TIME_IN_MIN, MAX_INGREDIENT_AMOUNT,
                                MIN_COOKING_TIME_IN_MIN, MIN_INGREDIENT_AMOUNT,
+                               RECIPE_IMAGE_VARIANT_FORMATS,
+                               RECIPE_IMAGE_VARIANTS,
+                               RECIPE_IMAGE_VARIANTS_PATH,
                                RECIPE_NAME_MAX_LENGTH, TAG_NAME_MAX_LENGTH)
 
 User = get_user_model()
 
 
+def change_counter(queryset, field, delta):
+    """Атомарно изменяет денормализованный счетчик у строк queryset."""
+    return queryset.update(
+        **{field: Greatest(models.F(field) + delta, 0)}
+    )
+
+
+class CatalogVersionQuerySet(models.QuerySet):
+    """QuerySet версий справочников."""
+
+    def versions(self, *names):
+        """Возвращает версии нескольких справочников одним запросом."""
+        versions = dict(self.filter(name__in=names).values_list(
+            'name', 'version'
+        ))
+        return tuple(versions.get(name, 0) for name in names)
+
+    def current(self, name):
+        """Возвращает текущую версию справочника."""
+        return self.get_or_create(name=name)[0]
+
+    def bump(self, name):
+        """Увеличивает версию справочника после его изменения."""
+        if not self.filter(name=name).update(
+            version=models.F('version') + 1, updated_at=timezone.now()
+        ):
+            self.get_or_create(name=name)
+
+
+class CatalogVersion(models.Model):
+    """Модель версий справочников тэгов и ингредиентов.
+    Используется для условных GET-запросов без обращения к самим
+    справочникам."""
+    TAGS = 'tags'
+    INGREDIENTS = 'ingredients'
+
+    name = models.CharField(
+        'Справочник',
+        max_length=CATALOG_NAME_MAX_LENGTH,
+        primary_key=True
+    )
+    version = models.PositiveIntegerField(
+        'Версия',
+        default=1
+    )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        default=timezone.now
+    )
+
+    objects = CatalogVersionQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Версия справочника'
+        verbose_name_plural = 'Версии справочников'
+
+    def __str__(self):
+        return f'{self.name} v{self.version}'
+
+
 class Ingredient(models.Model):
     """"Модель ингрeдиентов."""
     name = models.CharField(
@@ -68,13 +140,94 @@ class Tag(models.Model):
         return self.name
 
 
+def prefetch_recipe_relations(recipes):
+    """Подгружает тэги и ингредиенты уже полученных рецептов
+    фиксированным количеством запросов независимо от их числа."""
+    models.prefetch_related_objects(
+        recipes,
+        'tags',
+        models.Prefetch(
+            'total_ingredients',
+            queryset=IngredientInRecipe.objects.select_related('ingredient')
+        )
+    )
+
+
+def next_version():
+    """Выражение следующей версии рецепта, вычисляемое базой."""
+    return models.F('version') + 1
+
+
+class RecipeQuerySet(models.QuerySet):
+    """QuerySet рецептов с методами подгрузки связанных данных."""
+
+    def latest_per_author(self, limit):
+        """Не больше limit последних рецептов каждого автора из queryset.
+        Номер рецепта у автора считает оконная функция ROW_NUMBER
+        во вложенном запросе, а отбор по нему - внешний запрос."""
+        sql, params = self.annotate(position=Window(
+            expression=RowNumber(),
+            partition_by=[models.F('author')],
+            order_by=[models.F('pub_date').desc(), models.F('id').desc()]
+        )).order_by().values('id', 'position').query.sql_with_params()
+        return self.filter(pk__in=RawSQL(
+            f'SELECT id FROM ({sql}) AS ranked WHERE position <= %s',
+            (*params, limit)
+        ))
+
+    def bump_version(self, **fields):
+        """Атомарно увеличивает версии рецептов, от которых зависит
+        ключ кэша их представления, вместе с изменением полей fields."""
+        return self.update(version=next_version(), **fields)
+
+    def refresh_ingredient_ids(self):
+        """Пересобирает ingredient_ids рецептов по их ингредиентам
+        и увеличивает их версии одним запросом. Вызывается после
+        изменения строк состава в обход Recipe.save()."""
+        return self.bump_version(ingredient_ids=models.Func(
+            models.Subquery(IngredientInRecipe.objects.filter(
+                recipe=models.OuterRef('pk')
+            ).order_by('ingredient_id').values('ingredient_id')),
+            template='ARRAY%(expressions)s',
+            output_field=ArrayField(models.IntegerField())
+        ))
+
+    def with_user_flags(self, user):
+        """Аннотирует рецепты признаками избранного, списка покупок
+        и подписки пользователя на автора."""
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=models.Value(
+                    False, output_field=models.BooleanField()
+                ),
+                is_in_shopping_cart=models.Value(
+                    False, output_field=models.BooleanField()
+                ),
+                is_author_subscribed=models.Value(
+                    False, output_field=models.BooleanField()
+                ),
+            )
+        return self.annotate(
+            is_favorited=models.Exists(Favorite.objects.filter(
+                user=user, recipe=models.OuterRef('pk')
+            )),
+            is_in_shopping_cart=models.Exists(ShoppingCart.objects.filter(
+                user=user, recipe=models.OuterRef('pk')
+            )),
+            is_author_subscribed=models.Exists(Subscription.objects.filter(
+                user=user, author=models.OuterRef('author')
+            )),
+        )
+
+
 class Recipe(models.Model):
     """Модель рецептов."""
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='recipes',
-        verbose_name='Автор рецепта'
+        verbose_name='Автор рецепта',
+        db_index=False
     )
     name = models.CharField(
         'Название рецепта',
@@ -99,6 +252,30 @@ class Recipe(models.Model):
         upload_to='recipes/',
 
     )
+    image_small = models.ImageField(
+        'Уменьшенная картинка',
+        upload_to=RECIPE_IMAGE_VARIANTS_PATH,
+        blank=True,
+        editable=False
+    )
+    image_large = models.ImageField(
+        'Большая картинка',
+        upload_to=RECIPE_IMAGE_VARIANTS_PATH,
+        blank=True,
+        editable=False
+    )
+    image_small_jpeg = models.ImageField(
+        'Уменьшенная картинка в JPEG',
+        upload_to=RECIPE_IMAGE_VARIANTS_PATH,
+        blank=True,
+        editable=False
+    )
+    image_large_jpeg = models.ImageField(
+        'Большая картинка в JPEG',
+        upload_to=RECIPE_IMAGE_VARIANTS_PATH,
+        blank=True,
+        editable=False
+    )
     cooking_time = models.PositiveSmallIntegerField(
         'Время приготовления (в минутах)',
         validators=[
@@ -126,15 +303,109 @@ class Recipe(models.Model):
         verbose_name='Тэги',
         related_name='recipes'
     )
+    version = models.PositiveIntegerField(
+        'Версия',
+        default=1,
+        editable=False,
+        help_text='Увеличивается при каждом изменении рецепта или автора'
+    )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False,
+        help_text='Заполняется триггером БД по названию и описанию'
+    )
+    ingredient_ids = ArrayField(
+        models.IntegerField(),
+        verbose_name='Идентификаторы ингредиентов',
+        default=list,
+        editable=False,
+        help_text='Копия состава рецепта для фильтрации по GIN-индексу'
+    )
+    favorites_count = models.PositiveIntegerField(
+        'Добавлений в избранное',
+        default=0,
+        editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'Добавлений в список покупок',
+        default=0,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=['-favorites_count', '-id'],
+                         name='recipe_favorites_count_idx'),
+            models.Index(fields=['author', '-pub_date'],
+                         name='recipe_author_pub_date_idx'),
+            GinIndex(fields=['search_vector'],
+                     name='recipe_search_vector_idx'),
+            GinIndex(fields=['name'], name='recipe_name_trgm_idx',
+                     opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['ingredient_ids'],
+                     name='recipe_ingredient_ids_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        """Сохраняет рецепт, увеличивая версию тем же UPDATE, и
+        перечитывает ее: версия из памяти могла устареть."""
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+        self.version = next_version()
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=['version'])
+
+    @staticmethod
+    def get_image_variant_field(size, image_format):
+        """Имя поля варианта картинки: WebP хранится в image_<size>,
+        остальные форматы - в image_<size>_<format>."""
+        if image_format == 'webp':
+            return f'image_{size}'
+        return f'image_{size}_{image_format}'
+
+    def get_image_variant_name(self, size, image_format='webp'):
+        """Имя файла варианта картинки, соответствующего текущему
+        оригиналу."""
+        stem = os.path.splitext(os.path.basename(self.image.name))[0]
+        return f'{RECIPE_IMAGE_VARIANTS_PATH}{stem}_{size}.{image_format}'
+
+    def get_image_variant_names(self):
+        """Имена файлов всех вариантов картинки по полям модели."""
+        return {
+            self.get_image_variant_field(size, image_format):
+                self.get_image_variant_name(size, image_format)
+            for size in RECIPE_IMAGE_VARIANTS
+            for image_format in RECIPE_IMAGE_VARIANT_FORMATS
+        }
+
+    def get_image_variant(self, size, image_format='webp'):
+        """Возвращает готовый вариант картинки или оригинал, если
+        вариант для текущей картинки еще не построен."""
+        variant = getattr(self, self.get_image_variant_field(size,
+                                                             image_format))
+        if variant and variant.name == self.get_image_variant_name(
+            size, image_format
+        ):
+            return variant
+        return self.image
+
+    def has_image_variants(self):
+        return all(
+            getattr(self, field).name == name
+            for field, name in self.get_image_variant_names().items()
+        )
+
 
 class IngredientInRecipe(models.Model):
     """Модель для описания количества ингредиентов в отдельных рецептах"""
@@ -202,6 +473,10 @@ class Subscription(models.Model):
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['user', '-created_at'],
+                         name='subscription_user_created_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'author'],
@@ -230,20 +505,21 @@ class BaseFavShopCart(models.Model):
 
     class Meta:
         abstract = True
-        constraints = [
-            models.UniqueConstraint(
-                fields=['user', 'recipe'],
-                name='unique_user_recipe_connection'
-            )
-        ]
 
 
 class Favorite(BaseFavShopCart):
     """Модель для избранных рецептов."""
+    recipe_counter = 'favorites_count'
 
     class Meta:
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_favorite'
+            )
+        ]
 
     def __str__(self):
         return f'{self.user} добавил в избранное {self.recipe}'
@@ -251,9 +527,254 @@ class Favorite(BaseFavShopCart):
 
 class ShoppingCart(BaseFavShopCart):
     """Модель списка покупок."""
+    recipe_counter = 'in_carts_count'
+
     class Meta:
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_shopping_cart'
+            )
+        ]
 
     def __str__(self):
         return f'{self.user} добавил в список покупок {self.recipe}'
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+    """QuerySet агрегированного списка покупок."""
+
+    def live_totals(self, user_ids, ingredient_ids=None):
+        """Суммы ингредиентов, вычисленные по рецептам в списках покупок."""
+        totals = IngredientInRecipe.objects.filter(
+            recipe__shoppingcart_related__user__in=user_ids
+        )
+        if ingredient_ids is not None:
+            totals = totals.filter(ingredient__in=ingredient_ids)
+        return totals.values(
+            'ingredient',
+            user=models.F('recipe__shoppingcart_related__user'),
+        ).annotate(
+            total=models.Sum('amount')
+        ).order_by()
+
+    @transaction.atomic
+    def refresh(self, user_ids, ingredient_ids=None):
+        """Пересчитывает строки агрегата только для переданных
+        пользователей и ингредиентов."""
+        user_ids = list(User.objects.select_for_update().filter(
+            pk__in=user_ids
+        ).values_list('pk', flat=True))
+        if not user_ids:
+            return
+        stale = self.filter(user__in=user_ids)
+        if ingredient_ids is not None:
+            ingredient_ids = list(ingredient_ids)
+            stale = stale.filter(ingredient__in=ingredient_ids)
+        stale.delete()
+        self.bulk_create(
+            ShoppingListItem(user_id=row['user'],
+                             ingredient_id=row['ingredient'],
+                             amount=row['total'])
+            for row in self.live_totals(user_ids, ingredient_ids).iterator()
+        )
+
+
+class ShoppingListItem(models.Model):
+    """Модель агрегированного списка покупок: суммарное количество
+    каждого ингредиента по всем рецептам в списке покупок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент',
+    )
+    amount = models.PositiveIntegerField('Суммарное количество')
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Строки списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} {self.amount}'
+
+
+class FeedEntryQuerySet(models.QuerySet):
+    """QuerySet ленты подписок."""
+
+    def add(self, user_ids, recipes):
+        """Добавляет рецепты в ленты пользователей и обрезает ленты
+        до FEED_MAX_LENGTH записей."""
+        self.bulk_create(
+            (FeedEntry(user_id=user_id, recipe_id=recipe.id,
+                       author_id=recipe.author_id, pub_date=recipe.pub_date)
+             for user_id in user_ids for recipe in recipes),
+            batch_size=FEED_BATCH_SIZE,
+            ignore_conflicts=True
+        )
+        self.trim(user_ids)
+
+    def fan_out(self, recipe):
+        """Добавляет рецепт в ленты всех подписчиков автора."""
+        followers = Subscription.objects.filter(
+            author=recipe.author_id
+        ).order_by('user').values_list('user', flat=True)
+        last_user_id = 0
+        while True:
+            user_ids = list(
+                followers.filter(user__gt=last_user_id)[:FEED_BATCH_SIZE]
+            )
+            if not user_ids:
+                return
+            self.add(user_ids, [recipe])
+            last_user_id = user_ids[-1]
+
+    def backfill(self, user_id, author_id):
+        """Добавляет в ленту пользователя последние рецепты автора."""
+        self.add([user_id], Recipe.objects.filter(
+            author=author_id
+        ).order_by('-pub_date', '-id').only(
+            'id', 'author', 'pub_date'
+        )[:FEED_MAX_LENGTH])
+
+    def trim(self, user_ids):
+        """Удаляет записи лент, не попадающие в FEED_MAX_LENGTH
+        последних."""
+        table = connection.ops.quote_name(FeedEntry._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE id IN ('
+                'SELECT id FROM ('
+                'SELECT id, row_number() OVER ('
+                'PARTITION BY user_id ORDER BY pub_date DESC, recipe_id DESC'
+                f') AS position FROM {table} WHERE user_id = ANY(%s)'
+                ') ranked WHERE position > %s)',
+                [list(user_ids), FEED_MAX_LENGTH]
+            )
+
+    @transaction.atomic
+    def rebuild(self, users):
+        """Собирает ленты пользователей из queryset users заново
+        по текущим подпискам."""
+        self.filter(user__in=users).delete()
+        users_sql, params = users.order_by().values(
+            'pk'
+        ).query.sql_with_params()
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote(FeedEntry._meta.db_table)} '
+                '(user_id, recipe_id, author_id, pub_date) '
+                'SELECT user_id, recipe_id, author_id, pub_date FROM ('
+                'SELECT subscription.user_id, recipe.id AS recipe_id, '
+                'recipe.author_id, recipe.pub_date, row_number() OVER ('
+                'PARTITION BY subscription.user_id '
+                'ORDER BY recipe.pub_date DESC, recipe.id DESC'
+                ') AS position '
+                f'FROM {quote(Subscription._meta.db_table)} subscription '
+                f'JOIN {quote(Recipe._meta.db_table)} recipe '
+                'ON recipe.author_id = subscription.author_id '
+                f'WHERE subscription.user_id IN ({users_sql})'
+                ') ranked WHERE position <= %s',
+                [*params, FEED_MAX_LENGTH]
+            )
+            return cursor.rowcount
+
+
+class FeedEntry(models.Model):
+    """Модель записи ленты подписок: рецепт автора, на которого подписан
+    пользователь. Хранит дату публикации рецепта, чтобы лента читалась
+    одним проходом по индексу (user, -pub_date, -recipe)."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пользователь',
+        db_index=False
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор рецепта',
+    )
+    pub_date = models.DateTimeField('Дата публикации рецепта')
+
+    objects = FeedEntryQuerySet.as_manager()
+
+    class Meta:
+        ordering = ('-pub_date', '-recipe_id')
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-recipe'],
+                         name='feed_entry_user_pub_date_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.recipe}'
+
+
+class SimilarRecipe(models.Model):
+    """Модель похожего рецепта: предрассчитанный сосед рецепта
+    по составу ингредиентов и тэгам."""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт',
+        db_index=False
+    )
+    neighbour = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий рецепт',
+    )
+    score = models.FloatField('Сходство')
+
+    class Meta:
+        ordering = ('-score',)
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        indexes = [
+            models.Index(fields=['recipe', '-score'],
+                         name='similar_recipe_score_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'neighbour'],
+                name='unique_similar_recipe'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} ~ {self.neighbour}'
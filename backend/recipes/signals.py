@@ -0,0 +1,41 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from jobs.models import Job
+from recipes.models import CatalogVersion, Ingredient, Recipe, Tag
+from recipes.tasks import build_recipe_image_variants
+from users.models import User
+
+AUTHOR_PUBLIC_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def bump_tags_version(sender, **kwargs):
+    """Увеличивает версию справочника тэгов при его изменении."""
+    CatalogVersion.objects.bump(CatalogVersion.TAGS)
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def bump_ingredients_version(sender, **kwargs):
+    """Увеличивает версию справочника ингредиентов при его изменении."""
+    CatalogVersion.objects.bump(CatalogVersion.INGREDIENTS)
+
+
+@receiver(post_save, sender=Recipe)
+def process_recipe_image(sender, instance, **kwargs):
+    """Запускает построение вариантов картинки после ее изменения."""
+    if instance.image and not instance.has_image_variants():
+        Job.objects.enqueue(build_recipe_image_variants,
+                            recipe_id=instance.pk)
+
+
+@receiver(post_save, sender=User)
+def bump_author_recipes_version(sender, instance, update_fields=None,
+                                **kwargs):
+    """Увеличивает версии рецептов автора при изменении его данных,
+    которые выводятся в представлении рецепта."""
+    if update_fields is not None and not (
+        AUTHOR_PUBLIC_FIELDS & set(update_fields)
+    ):
+        return
+    Recipe.objects.filter(author=instance).bump_version()
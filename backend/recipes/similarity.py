@@ -0,0 +1,392 @@
+from collections import defaultdict
+from itertools import chain
+
+import numpy as np
+from django.db import connection, transaction
+
+from recipes.constants import (SIMILAR_BLOCK_PAIRS,
+                               SIMILAR_COMMON_FEATURE_MIN_RECIPES,
+                               SIMILAR_COMMON_FEATURE_SHARE,
+                               SIMILAR_RECIPES_COUNT, SIMILAR_TAG_WEIGHT)
+from recipes.models import IngredientInRecipe, Recipe, SimilarRecipe
+
+SCORE_PRECISION = 9
+TAG_WORD_BITS = 64
+
+COMMON_FEATURES = """
+SELECT feature.id FROM unnest(%s) AS feature(id)
+WHERE (
+    SELECT count(*) FROM (
+        SELECT 1 FROM recipes_ingredientinrecipe
+        WHERE ingredient_id = feature.id
+        LIMIT %s
+    ) AS sample
+) > %s
+"""
+
+BEATEN_TOPS = """
+SELECT change.recipe_id
+FROM unnest(%s::integer[], %s::double precision[])
+    AS change(recipe_id, score)
+WHERE change.score >= coalesce((
+    SELECT score FROM recipes_similarrecipe
+    WHERE recipe_id = change.recipe_id
+    ORDER BY score DESC
+    OFFSET %s LIMIT 1
+), 0) - %s
+"""
+
+
+def load_pairs(queryset, *fields):
+    """Пары значений из queryset в виде массива NumPy формы (n, 2)."""
+    return np.fromiter(
+        chain.from_iterable(queryset.order_by().values_list(*fields)
+                            .iterator()),
+        dtype=np.int64
+    ).reshape(-1, 2)
+
+
+def segments(starts, lengths):
+    """Индексы элементов всех отрезков [start, start + length)."""
+    ends = np.cumsum(lengths)
+    return np.repeat(starts - ends + lengths, lengths) + np.arange(ends[-1])
+
+
+def popcount(words):
+    """Количество единичных битов в каждой строке массива uint64."""
+    words = words - ((words >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    words = ((words & np.uint64(0x3333333333333333))
+             + ((words >> np.uint64(2)) & np.uint64(0x3333333333333333)))
+    words = (words + (words >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return ((words * np.uint64(0x0101010101010101)) >> np.uint64(56)).sum(
+        axis=1
+    )
+
+
+def common_feature_limit():
+    """Число рецептов, в которых ингредиент считается слишком частым."""
+    return max(SIMILAR_COMMON_FEATURE_MIN_RECIPES,
+               SIMILAR_COMMON_FEATURE_SHARE * Recipe.objects.count())
+
+
+def find_common_features(feature_ids, limit):
+    """Ингредиенты из feature_ids, встречающиеся больше чем в limit
+    рецептах. Для каждого ингредиента читается не больше limit + 1
+    строк индекса."""
+    if not len(feature_ids):
+        return np.empty(0, dtype=np.int64)
+    with connection.cursor() as cursor:
+        cursor.execute(COMMON_FEATURES,
+                       [feature_ids.tolist(), int(limit) + 1, limit])
+        return np.array([row[0] for row in cursor.fetchall()],
+                        dtype=np.int64)
+
+
+def find_beaten_tops(changes):
+    """Рецепты, в сохраненный топ которых может войти рецепт с новым
+    сходством из changes: топ неполный или сходство не ниже
+    последнего места."""
+    if not changes:
+        return set()
+    recipe_ids = list(changes)
+    with connection.cursor() as cursor:
+        cursor.execute(BEATEN_TOPS, [
+            recipe_ids,
+            [max(changes[recipe_id].values()) for recipe_id in recipe_ids],
+            SIMILAR_RECIPES_COUNT - 1,
+            10 ** -SCORE_PRECISION
+        ])
+        return {row[0] for row in cursor.fetchall()}
+
+
+def order_key(item):
+    """Ключ сортировки пары (сосед, сходство) как в топе соседей."""
+    neighbour_id, score = item
+    return -round(score, SCORE_PRECISION), neighbour_id
+
+
+def ranks(rows, order, count):
+    """Место каждого элемента order внутри своей строки, если rows
+    отсортированы, а order не меняет порядок строк."""
+    return np.arange(len(rows)) - np.searchsorted(
+        rows, np.arange(count)
+    )[rows[order]]
+
+
+class SimilarityIndex:
+    """Разреженная матрица рецепт x ингредиент в двух представлениях:
+    списки ингредиентов рецептов и инвертированный индекс рецептов
+    по ингредиентам, а также битовые маски тэгов рецептов.
+
+    Сходство - коэффициент Жаккара по ингредиентам плюс
+    SIMILAR_TAG_WEIGHT коэффициента Жаккара по тэгам. Ингредиенты,
+    встречающиеся в большой доле рецептов (соль, вода), не учитываются:
+    они почти не отличают рецепты друг от друга, а их списки рецептов
+    занимают основную часть вычислений.
+    """
+
+    def __init__(self, pairs, tag_pairs, common_features):
+        self.recipe_ids = np.unique(pairs[:, 0])
+        pairs = pairs[~np.isin(pairs[:, 1], common_features)]
+        recipes = np.searchsorted(self.recipe_ids, pairs[:, 0])
+        features = np.unique(pairs[:, 1], return_inverse=True)[1]
+        order = np.lexsort((features, recipes))
+        self.recipe_features = features[order]
+        self.sizes = np.bincount(recipes, minlength=len(self.recipe_ids))
+        self.recipe_starts = np.cumsum(self.sizes) - self.sizes
+        order = np.argsort(features, kind='stable')
+        self.feature_recipes = recipes[order]
+        self.feature_counts = np.bincount(features)
+        self.feature_starts = (np.cumsum(self.feature_counts)
+                               - self.feature_counts)
+        self.tags = self.load_tags(tag_pairs)
+
+    @classmethod
+    def load(cls):
+        """Индекс по всем рецептам."""
+        pairs = load_pairs(IngredientInRecipe.objects.all(),
+                           'recipe_id', 'ingredient_id')
+        features, counts = np.unique(pairs[:, 1], return_counts=True)
+        return cls(
+            pairs,
+            load_pairs(Recipe.tags.through.objects.all(),
+                       'recipe_id', 'tag_id'),
+            features[counts > common_feature_limit()]
+        )
+
+    @classmethod
+    def around(cls, recipe_ids):
+        """Индекс по рецептам recipe_ids и рецептам, у которых есть
+        общий с ними значимый ингредиент. Сходство этих рецептов
+        с остальными в таком индексе рассчитывается точно."""
+        limit = common_feature_limit()
+        own = load_pairs(
+            IngredientInRecipe.objects.filter(recipe__in=recipe_ids),
+            'recipe_id', 'ingredient_id'
+        )
+        own_features = np.unique(own[:, 1])
+        common = find_common_features(own_features, limit)
+        candidates = IngredientInRecipe.objects.filter(
+            ingredient__in=np.setdiff1d(own_features, common).tolist()
+        ).values('recipe')
+        pairs = np.concatenate((own, load_pairs(
+            IngredientInRecipe.objects.filter(
+                recipe__in=candidates
+            ).exclude(recipe__in=recipe_ids),
+            'recipe_id', 'ingredient_id'
+        )))
+        tags = Recipe.tags.through.objects
+        return cls(
+            pairs,
+            np.concatenate((
+                load_pairs(tags.filter(recipe__in=recipe_ids),
+                           'recipe_id', 'tag_id'),
+                load_pairs(tags.filter(recipe__in=candidates).exclude(
+                    recipe__in=recipe_ids
+                ), 'recipe_id', 'tag_id')
+            )),
+            np.concatenate((common, find_common_features(
+                np.setdiff1d(pairs[:, 1], own_features), limit
+            )))
+        )
+
+    def load_tags(self, pairs):
+        pairs = pairs[np.isin(pairs[:, 0], self.recipe_ids)]
+        tags = np.unique(pairs[:, 1], return_inverse=True)[1]
+        words = np.zeros(
+            (len(self.recipe_ids),
+             max(1, -(-(tags.max(initial=-1) + 1) // TAG_WORD_BITS))),
+            dtype=np.uint64
+        )
+        np.bitwise_or.at(
+            words,
+            (np.searchsorted(self.recipe_ids, pairs[:, 0]),
+             tags // TAG_WORD_BITS),
+            np.left_shift(np.uint64(1),
+                          (tags % TAG_WORD_BITS).astype(np.uint64))
+        )
+        return words
+
+    def positions(self, recipe_ids):
+        """Позиции в индексе для рецептов, у которых есть ингредиенты."""
+        return np.intersect1d(
+            self.recipe_ids, np.fromiter(recipe_ids, dtype=np.int64),
+            return_indices=True
+        )[1]
+
+    def blocks(self, positions):
+        """Делит рецепты на блоки, в каждом из которых обход списков
+        ингредиентов дает не больше SIMILAR_BLOCK_PAIRS пар."""
+        totals = np.concatenate(([0], np.cumsum(
+            self.feature_counts[self.recipe_features]
+        )))
+        work = np.cumsum(
+            totals[self.recipe_starts[positions] + self.sizes[positions]]
+            - totals[self.recipe_starts[positions]]
+        )
+        return np.split(positions, np.searchsorted(
+            work, np.arange(SIMILAR_BLOCK_PAIRS, work[-1], SIMILAR_BLOCK_PAIRS)
+        )) if len(positions) else []
+
+    def similarities(self, positions, prune=True):
+        """Сходство рецептов блока со всеми кандидатами, отсортированное
+        по строкам блока и позициям кандидатов. Возвращает массивы строк
+        блока, позиций кандидатов и сходства. С prune отбрасываются
+        кандидаты, которые не могут попасть в топ соседей."""
+        lengths = self.sizes[positions]
+        if not lengths.sum():
+            return (np.empty(0, dtype=np.int64),) * 2 + (np.empty(0),)
+        rows = np.repeat(np.arange(len(positions)), lengths)
+        features = self.recipe_features[
+            segments(self.recipe_starts[positions], lengths)
+        ]
+        counts = self.feature_counts[features]
+        rows = np.repeat(rows, counts)
+        candidates = self.feature_recipes[
+            segments(self.feature_starts[features], counts)
+        ]
+        other = candidates != positions[rows]
+        keys, shared = np.unique(
+            rows[other] * len(self.recipe_ids) + candidates[other],
+            return_counts=True
+        )
+        rows, candidates = np.divmod(keys, len(self.recipe_ids))
+        scores = shared / (self.sizes[positions[rows]]
+                           + self.sizes[candidates] - shared)
+        if prune and len(keys):
+            # Тэги добавляют к сходству не больше SIMILAR_TAG_WEIGHT,
+            # поэтому кандидаты, отстающие от k-го по ингредиентам больше
+            # чем на этот вес, в топ попасть не могут и для них тэги
+            # не сравниваются.
+            order = np.argsort(rows + (1 - scores) / 2)
+            kth = order[ranks(rows, order, len(positions))
+                        == SIMILAR_RECIPES_COUNT - 1]
+            threshold = np.zeros(len(positions))
+            threshold[rows[kth]] = scores[kth]
+            close = scores >= threshold[rows] - SIMILAR_TAG_WEIGHT
+            rows, candidates = rows[close], candidates[close]
+            scores = scores[close]
+        source_tags = self.tags[positions[rows]]
+        candidate_tags = self.tags[candidates]
+        union = popcount(source_tags | candidate_tags)
+        scores += SIMILAR_TAG_WEIGHT * np.divide(
+            popcount(source_tags & candidate_tags), union,
+            out=np.zeros(len(union)), where=union > 0
+        )
+        return rows, candidates, scores
+
+    def neighbours(self, positions):
+        """Топ SIMILAR_RECIPES_COUNT соседей для блока рецептов.
+        Возвращает массивы позиций рецептов, соседей и сходства."""
+        rows, candidates, scores = self.similarities(positions)
+        # Кандидаты внутри строки идут по возрастанию, устойчивая
+        # сортировка сохраняет этот порядок для равного сходства.
+        order = np.argsort(rows + (1 - scores.round(SCORE_PRECISION)) / 2,
+                           kind='stable')
+        keep = order[ranks(rows, order, len(positions))
+                     < SIMILAR_RECIPES_COUNT]
+        return positions[rows[keep]], candidates[keep], scores[keep]
+
+    def save(self, positions):
+        """Сохраняет соседей рецептов. Возвращает количество строк."""
+        saved = 0
+        for block in self.blocks(positions):
+            sources, candidates, scores = self.neighbours(block)
+            saved += save_neighbours(zip(
+                self.recipe_ids[sources].tolist(),
+                self.recipe_ids[candidates].tolist(),
+                scores.tolist()
+            ))
+        return saved
+
+
+def save_neighbours(rows):
+    """Сохраняет тройки (рецепт, сосед, сходство). Возвращает
+    количество строк."""
+    return len(SimilarRecipe.objects.bulk_create(
+        SimilarRecipe(recipe_id=recipe_id, neighbour_id=neighbour_id,
+                      score=score)
+        for recipe_id, neighbour_id, score in rows
+    ))
+
+
+@transaction.atomic
+def rebuild_similar_recipes():
+    """Пересчитывает похожие рецепты для всех рецептов."""
+    index = SimilarityIndex.load()
+    SimilarRecipe.objects.all().delete()
+    return index.save(np.arange(len(index.recipe_ids)))
+
+
+@transaction.atomic
+def recompute_similar_recipes(recipe_ids):
+    """Пересчитывает топ соседей рецептов целиком, не меняя топы других
+    рецептов. Нужно, когда состав рецептов прежний, но из их топа
+    пропал сосед, например удаленный рецепт."""
+    recipe_ids = set(recipe_ids)
+    index = SimilarityIndex.around(recipe_ids)
+    SimilarRecipe.objects.filter(recipe__in=recipe_ids).delete()
+    return index.save(index.positions(recipe_ids))
+
+
+@transaction.atomic
+def update_similar_recipes(recipe_ids):
+    """Пересчитывает похожие рецепты после изменения состава рецептов.
+
+    Индекс строится только по измененным рецептам и рецептам с общими
+    значимыми ингредиентами. Измененные рецепты получают новый топ
+    соседей. Для остальных новое сходство с измененными рецептами
+    вливается в сохраненный топ, если оно выше его последнего места
+    или измененный рецепт уже был в топе и стал ближе. Если измененный
+    рецепт был в полном топе и отдалился, неизвестно, кто займет его
+    место, и такой рецепт пересчитывается целиком.
+    """
+    recipe_ids = set(recipe_ids)
+    index = SimilarityIndex.around(recipe_ids)
+    positions = index.positions(recipe_ids)
+    rows, candidates, scores = index.similarities(positions, prune=False)
+    changes = defaultdict(dict)
+    for recipe_id, neighbour_id, score in zip(
+        index.recipe_ids[candidates].tolist(),
+        index.recipe_ids[positions[rows]].tolist(),
+        scores.tolist()
+    ):
+        if recipe_id not in recipe_ids:
+            changes[recipe_id][neighbour_id] = score
+    referencing = set(SimilarRecipe.objects.filter(
+        neighbour__in=recipe_ids
+    ).exclude(recipe__in=recipe_ids).values_list('recipe', flat=True))
+    merged = referencing | find_beaten_tops(changes)
+    stored = defaultdict(dict)
+    for recipe_id, neighbour_id, score in SimilarRecipe.objects.filter(
+        recipe__in=merged
+    ).values_list('recipe', 'neighbour', 'score'):
+        stored[recipe_id][neighbour_id] = score
+    recompute = set()
+    rows = []
+    for recipe_id in merged:
+        neighbours = stored[recipe_id]
+        new_scores = changes.get(recipe_id, {})
+        if len(neighbours) >= SIMILAR_RECIPES_COUNT and any(
+            order_key((neighbour_id, new_scores.get(neighbour_id, 0)))
+            > order_key((neighbour_id, neighbours[neighbour_id]))
+            for neighbour_id in recipe_ids & neighbours.keys()
+        ):
+            recompute.add(recipe_id)
+            continue
+        for neighbour_id in recipe_ids - new_scores.keys():
+            neighbours.pop(neighbour_id, None)
+        neighbours.update(new_scores)
+        rows.extend(
+            (recipe_id, neighbour_id, score)
+            for neighbour_id, score in sorted(
+                neighbours.items(), key=order_key
+            )[:SIMILAR_RECIPES_COUNT]
+        )
+    SimilarRecipe.objects.filter(
+        recipe__in=recipe_ids | (merged - recompute)
+    ).delete()
+    saved = index.save(positions) + save_neighbours(rows)
+    if recompute:
+        saved += recompute_similar_recipes(recompute)
+    return saved
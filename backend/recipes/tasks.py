@@ -0,0 +1,37 @@
+from jobs.registry import task
+from recipes.images import build_image_variants
+from recipes.models import FeedEntry, Recipe, ShoppingListItem
+from recipes.similarity import (recompute_similar_recipes,
+                                update_similar_recipes)
+
+
+@task
+def build_recipe_image_variants(recipe_id):
+    """Строит уменьшенные варианты картинки рецепта."""
+    build_image_variants(recipe_id)
+
+
+@task
+def refresh_shopping_lists(user_ids, ingredient_ids=None):
+    """Пересчитывает агрегированные списки покупок пользователей."""
+    ShoppingListItem.objects.refresh(user_ids, ingredient_ids)
+
+
+@task
+def fan_out_recipe(recipe_id):
+    """Добавляет новый рецепт в ленты подписчиков автора."""
+    recipe = Recipe.objects.filter(pk=recipe_id).only(
+        'id', 'author', 'pub_date'
+    ).first()
+    if recipe is not None:
+        FeedEntry.objects.fan_out(recipe)
+
+
+@task
+def refresh_similar_recipes(recipe_ids, own_only=False):
+    """Пересчитывает похожие рецепты после изменения состава рецептов.
+    С own_only состав прежний и пересчитываются только их топы."""
+    if own_only:
+        recompute_similar_recipes(recipe_ids)
+    else:
+        update_similar_recipes(recipe_ids)
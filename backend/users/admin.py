@@ -1,7 +1,11 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
 from django_admin_display import admin_display
 
+from recipes.models import Subscription
+
 from .models import User
 
 
@@ -10,14 +14,30 @@ class MyUserAdmin(UserAdmin):
     """"Модель для отображения aдмин-зоны пользователей."""
     list_display = ('username', 'email', 'first_name', 'last_name',
                     'count_subscriptions', 'count_recipes')
-    list_filter = ('username', 'email')
+    list_filter = ('is_staff', 'is_active')
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        """Метод получения пользователей с количеством подписок,
+        подсчитанным подзапросом только для строк страницы."""
+        return super().get_queryset(request).annotate(
+            subscriptions_count=Coalesce(Subquery(
+                Subscription.objects.filter(
+                    user=OuterRef('pk')
+                ).order_by().values('user').annotate(
+                    total=Count('pk')
+                ).values('total')
+            ), Value(0))
+        )
 
-    @admin_display(short_description='Количество подписок',)
+    @admin_display(short_description='Количество подписок',
+                   admin_order_field='subscriptions_count')
     def count_subscriptions(self, obj):
-        """"Метод подсчета количества подписок."""
-        return User.objects.get(id=obj.id).follower.count()
+        """"Метод вывода количества подписок."""
+        return obj.subscriptions_count
 
-    @admin_display(short_description='Количество рецептов',)
+    @admin_display(short_description='Количество рецептов',
+                   admin_order_field='recipes_count')
     def count_recipes(self, obj):
-        """"Метод подсчета количества рецептов."""
-        return User.objects.get(id=obj.id).recipes.count()
+        """"Метод вывода количества рецептов."""
+        return obj.recipes_count